@@ -67,8 +67,12 @@ REST_FRAMEWORK = {
     
     'DEFAULT_AUTHENTICATION_CLASSES': (
         
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
-    )
+        'ecomapp.authentication.ClaimsJWTAuthentication',
+    ),
+
+    'DEFAULT_THROTTLE_CLASSES': (
+        'ecomapp.throttling.TokenBucketThrottle',
+    ),
   
 }
 SWAGGER_SETTINGS = {
@@ -82,7 +86,15 @@ SWAGGER_SETTINGS = {
     'USE_SESSION_AUTH': False,
     'LOGIN_URL': 'rest_framework:login',
     'LOGOUT_URL': 'rest_framework:logout',
+    'DEFAULT_INFO': 'ecom.urls.api_info',
+    'SPEC_URL': ('schema-json', {'format': '.json'}),
 }
+REDOC_SETTINGS = {
+    'SPEC_URL': ('schema-json', {'format': '.json'}),
+}
+
+# Written by `manage.py build_openapi_schema` at deploy and served from memory (see ecomapp/openapi.py)
+OPENAPI_SCHEMA_PATH = BASE_DIR / 'openapi.json'
 
 ROOT_URLCONF = 'ecom.urls'
 
@@ -169,15 +181,64 @@ EMAIL_HOST_PASSWORD = 'fnap luqv mfjh ywwk'
 EMAIL_USE_TLS =True
 EMAIL_USE_SSL = False
 
+# Outbox worker (manage.py send_outbox_emails): attempts per email and the retry backoff in seconds,
+# doubling from OUTBOX_RETRY_BACKOFF up to OUTBOX_MAX_BACKOFF (see ecomapp/outbox.py)
+OUTBOX_MAX_ATTEMPTS = 8
+OUTBOX_RETRY_BACKOFF = 60
+OUTBOX_MAX_BACKOFF = 3600
 
+
+# LocMemCache is per process: catalog versions (ecomapp/cache.py) and rate-limit counters
+# (ecomapp/throttling.py) are then only shared by the threads of one worker. Point this at a shared
+# backend, e.g. 'django.core.cache.backends.redis.RedisCache', when running several workers
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
 
+# Per-process LRU of serialized public catalog responses (see ecomapp/cache.py); entries expire after
+# CATALOG_CACHE_TTL seconds, the longest a worker serves a catalog changed through another worker
+# when CACHES is not shared
+CATALOG_CACHE_MAX_ENTRIES = 2048
+CATALOG_CACHE_TTL = 30
+
+# Worker threads generating product image thumbnails and compressed variants (see ecomapp/images.py)
+IMAGE_PROCESSING_WORKERS = 2
+
+# Per-process cache of user rows behind token-claims authentication (see ecomapp/authentication.py)
+USER_CACHE_TTL = 60
+USER_CACHE_MAX_ENTRIES = 10000
+
+# Order status feed (see ecomapp/feed.py): seconds between polls of the event log, how long a missing
+# event id holds back later ones, events kept in memory per process, and SSE keep-alive interval
+STATUS_FEED_POLL_INTERVAL = 1.0
+STATUS_FEED_GAP_TIMEOUT = 5.0
+STATUS_FEED_BUFFER_SIZE = 10000
+STATUS_FEED_HEARTBEAT = 15
+
+# Token-bucket request budgets (see ecomapp/throttling.py): the number is the burst size, refilled
+# evenly over the period. `company` is shared by all users of one company, on top of their own budget.
+# Buckets are per worker unless CACHES is shared (Redis)
+TOKEN_BUCKET_RATES = {
+    'anon': '300/min',
+    'customer': '600/min',
+    'staff': '1200/min',
+    'admin': '1200/min',
+    'company': '6000/min',
+}
+
+# Failed logins allowed per sliding window, as (attempts, seconds) (see ecomapp/throttling.py);
+# counted per worker unless CACHES is shared
+LOGIN_THROTTLE_RATES = {
+    'ip': (50, 300),
+    'email': (5, 300),
+}
+
 
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=59),
-    'REFRESH_TOKEN_LIFETIME': timedelta(days=1)
+    'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
+    'TOKEN_OBTAIN_SERIALIZER': 'ecomapp.authentication.ClaimsTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'ecomapp.authentication.ClaimsTokenRefreshSerializer',
 }
@@ -0,0 +1,215 @@
+"""
+Async versions of the hot read endpoints, for deployments served through ecom/asgi.py.
+
+They return the same payloads as their DRF counterparts but query with Django's async ORM, so a
+request waiting on the database or on a slow client doesn't hold a worker thread. Authentication
+and rate limits match the DRF views; the per-process catalog cache and conditional GET are not
+applied here.
+"""
+import json
+import math
+from functools import wraps
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.db.models import Sum,Count,Window
+from django.http import JsonResponse,StreamingHttpResponse
+from rest_framework import exceptions
+from .authentication import ClaimsJWTAuthentication
+from .feed import status_feed,event_scope,serialize_event
+from .models import Product,Order,CartItem
+from .serializers import ProductSerializer,UserOrderSerializer,CartSummarySerializer
+from .throttling import TokenBucketThrottle
+
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+MAX_POLL_TIMEOUT = 60
+
+authenticator = ClaimsJWTAuthentication()
+
+
+def error(detail, status, headers=None):
+    return JsonResponse({'detail': detail}, status=status, headers=headers)
+
+
+def async_read(login_required=False):
+    """
+    Wrap an async GET view with JWT authentication and the token-bucket throttle.
+    """
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return error(f'Method "{request.method}" not allowed.', 405, headers={'Allow': 'GET, HEAD'})
+            try:
+                authenticated = await authenticator.aauthenticate(request)
+            except exceptions.APIException as exc:
+                body = exc.detail if isinstance(exc.detail, dict) else {'detail': exc.detail}
+                return JsonResponse(body, status=exc.status_code, headers={'WWW-Authenticate': authenticator.authenticate_header(request)})
+            request.user = authenticated[0] if authenticated else AnonymousUser()
+            if login_required and not request.user.is_authenticated:
+                return error('Authentication credentials were not provided.', 401, headers={'WWW-Authenticate': authenticator.authenticate_header(request)})
+
+            throttle = TokenBucketThrottle()
+            if not await sync_to_async(throttle.allow_request, thread_sensitive=False)(request, None):
+                wait = math.ceil(throttle.wait())
+                return error(f'Request was throttled. Expected available in {wait} seconds.', 429, headers={'Retry-After': str(wait)})
+            return await view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def page_size(request):
+    try:
+        return max(1, min(int(request.GET.get('page_size', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE))
+    except ValueError:
+        return DEFAULT_PAGE_SIZE
+
+
+def int_params(request, *names):
+    """
+    Integer query parameters that are present; raises ValueError on a malformed one.
+    """
+    return {name: int(request.GET[name]) for name in names if request.GET.get(name)}
+
+
+def keyset_page(request, rows, size, cursor_param):
+    """
+    `{'next', 'results'}` from `size + 1` fetched rows; the next link continues after the last row's id.
+    """
+    next_url = None
+    if len(rows) > size:
+        rows = rows[:size]
+        params = request.GET.copy()
+        params[cursor_param] = rows[-1].id
+        next_url = request.build_absolute_uri(f'{request.path}?{params.urlencode()}')
+    return next_url, rows
+
+
+def product_queryset(user):
+    queryset = Product.objects.prefetch_related('images')
+    if user.is_authenticated and user.company_user_id:
+        return queryset.filter(company_id=user.company_user_id)
+    return queryset
+
+
+@async_read()
+async def product_list(request):
+    """
+    Products in id order, filtered by `category`/`company`, paged with `after=<last id>`.
+    """
+    try:
+        filters = int_params(request, 'category', 'company', 'after')
+    except ValueError:
+        return error('category, company and after must be integers.', 400)
+    after = filters.pop('after', None)
+    queryset = product_queryset(request.user).filter(**{f'{name}_id': value for name, value in filters.items()})
+    if after is not None:
+        queryset = queryset.filter(id__gt=after)
+
+    size = page_size(request)
+    products = [product async for product in queryset.order_by('id')[:size + 1]]
+    next_url, products = keyset_page(request, products, size, 'after')
+    return JsonResponse({'next': next_url, 'results': ProductSerializer(products, many=True, context={'request': request}).data})
+
+
+@async_read()
+async def product_detail(request, pk):
+    product = await product_queryset(request.user).filter(pk=pk).afirst()
+    if product is None:
+        return error('No Product matches the given query.', 404)
+    return JsonResponse(ProductSerializer(product, context={'request': request}).data)
+
+
+@async_read(login_required=True)
+async def cart_summary(request):
+    """
+    Same payload as `GET /cart/summary/`, from the same single query.
+    """
+    items = [
+        item async for item in CartItem.objects.filter(cart__user=request.user)
+        .select_related('product')
+        .annotate(cart_total=Window(Sum('total_price')), cart_quantity=Window(Sum('quantity')), cart_lines=Window(Count('id')))
+        .order_by('id')
+    ]
+    first = items[0] if items else None
+    return JsonResponse(CartSummarySerializer({
+        'items': items,
+        'item_count': first.cart_lines if first else 0,
+        'total_quantity': first.cart_quantity if first else 0,
+        'total_price': first.cart_total if first else 0,
+    }).data)
+
+
+@async_read(login_required=True)
+async def order_list(request):
+    """
+    The caller's orders with their items, newest first, paged with `before=<last id>`.
+    """
+    try:
+        before = int_params(request, 'before').get('before')
+    except ValueError:
+        return error('before must be an integer.', 400)
+    queryset = Order.objects.filter(user=request.user).prefetch_related('order_items')
+    if before is not None:
+        queryset = queryset.filter(id__lt=before)
+
+    size = page_size(request)
+    orders = [order async for order in queryset.order_by('-id')[:size + 1]]
+    next_url, orders = keyset_page(request, orders, size, 'before')
+    return JsonResponse({'next': next_url, 'results': UserOrderSerializer(orders, many=True, context={'request': request}).data})
+
+
+@async_read(login_required=True)
+async def order_events(request):
+    """
+    Long-poll for status changes on the caller's orders (customers) or their company's orders (staff).
+
+    Returns `{'cursor', 'events'}` as soon as there are events after `after`, or an empty list once
+    `timeout` seconds (default 25, at most 60) pass; pass the returned cursor as the next `after`.
+    Without `after` the feed starts from now.
+    """
+    try:
+        params = int_params(request, 'after', 'timeout')
+    except ValueError:
+        return error('after and timeout must be integers.', 400)
+    scope = event_scope(request.user)
+    cursor = params['after'] if 'after' in params else await status_feed.head()
+    timeout = max(0, min(params.get('timeout', 25), MAX_POLL_TIMEOUT))
+
+    events = await status_feed.wait(scope, cursor, timeout, limit=page_size(request))
+    if events:
+        cursor = events[-1].id
+    return JsonResponse({'cursor': cursor, 'events': [serialize_event(event) for event in events]})
+
+
+@async_read(login_required=True)
+async def order_event_stream(request):
+    """
+    The same feed as a server-sent event stream. Each event's `id` is its cursor, so reconnecting
+    clients resume through `Last-Event-ID` (or `after`); a comment line is sent while idle.
+    """
+    try:
+        cursor = int(request.headers.get('Last-Event-ID') or request.GET.get('after') or -1)
+    except ValueError:
+        return error('Last-Event-ID and after must be integers.', 400)
+    scope = event_scope(request.user)
+    if cursor < 0:
+        cursor = await status_feed.head()
+    heartbeat = getattr(settings, 'STATUS_FEED_HEARTBEAT', 15)
+
+    async def stream(cursor):
+        yield f'retry: {heartbeat * 1000}\n\n'
+        while True:
+            events = await status_feed.wait(scope, cursor, heartbeat)
+            if not events:
+                yield ': keep-alive\n\n'
+            for event in events:
+                cursor = event.id
+                yield f'id: {event.id}\nevent: status\ndata: {json.dumps(serialize_event(event))}\n\n'
+
+    response = StreamingHttpResponse(stream(cursor), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
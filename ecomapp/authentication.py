@@ -0,0 +1,117 @@
+from asgiref.sync import sync_to_async
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed,InvalidToken
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer,TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from .cache import user_cache
+from .models import ClaimsUser,CustomUser
+
+
+# User fields copied into every access token; requests only need these for auth and permission checks
+USER_CLAIMS = ['email', 'role', 'company_user_id', 'is_active', 'is_staff', 'is_superuser']
+
+
+def add_user_claims(token, user):
+    for claim in USER_CLAIMS:
+        token[claim] = getattr(user, claim)
+    return token
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """
+    `/token/` pair whose tokens carry the user claims, like the ones issued by `/login/`.
+    """
+
+    @classmethod
+    def get_token(cls, user):
+        return add_user_claims(super().get_token(user), user)
+
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    `/token/refresh/` that reloads the user: inactive or deleted users are refused and the new access
+    token carries the user's current claims instead of the ones copied from the refresh token.
+    """
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        user = CustomUser.objects.filter(**{api_settings.USER_ID_FIELD: refresh[api_settings.USER_ID_CLAIM]}).first()
+        if user is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        add_user_claims(refresh, user)
+        user_cache.invalidate(user.pk)
+
+        data = {'access': str(refresh.access_token)}
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            if api_settings.BLACKLIST_AFTER_ROTATION:
+                try:
+                    refresh.blacklist()
+                except AttributeError:
+                    # token_blacklist isn't installed
+                    pass
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            data['refresh'] = str(refresh)
+        return data
+
+
+def tokens_for_user(user):
+    return ClaimsTokenObtainPairSerializer.get_token(user)
+
+
+def has_user_claims(validated_token):
+    return all(claim in validated_token for claim in USER_CLAIMS)
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that builds `request.user` from the token's claims, without a user query.
+
+    The user is a ClaimsUser with only the claimed fields loaded; other fields come from the
+    per-process user cache on first access. Tokens issued before claims were added are served from
+    that cache too. Claims are fixed when the access token is issued; role, company or activation changes
+    apply to access tokens issued afterwards by login or by ClaimsTokenRefreshSerializer, so within
+    ACCESS_TOKEN_LIFETIME.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        if has_user_claims(validated_token):
+            if not validated_token['is_active']:
+                raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+            # Fields left out here are deferred and ClaimsUser loads them from the user cache
+            loaded = {api_settings.USER_ID_FIELD: user_id, **{claim: validated_token[claim] for claim in USER_CLAIMS}}
+            field_names = [field.attname for field in ClaimsUser._meta.concrete_fields if field.attname in loaded]
+            return ClaimsUser.from_db(None, field_names, [loaded[name] for name in field_names])
+
+        try:
+            user = user_cache.get(user_id)
+        except CustomUser.DoesNotExist:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return user
+
+    async def aauthenticate(self, request):
+        """
+        `authenticate` for async views: token checks run inline and only tokens without claims,
+        which may need the user row, hop to a thread.
+        """
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        if has_user_claims(validated_token):
+            return self.get_user(validated_token), validated_token
+        return await sync_to_async(self.get_user)(validated_token), validated_token
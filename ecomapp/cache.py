@@ -0,0 +1,157 @@
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+
+
+VERSION_KEY = 'catalog_version:{}'
+MODIFIED_KEY = 'catalog_modified:{}'
+ALL_COMPANIES = '*'
+
+
+def catalog_version(company_id=ALL_COMPANIES):
+    """
+    Current catalog version for a company, or for the whole catalog with `*`.
+    Versions live in the Django cache: every worker sees a bump only when `CACHES` points at a shared
+    backend such as Redis. With the default LocMemCache each process keeps its own counters, and
+    `CatalogCache` entries expiring after `CATALOG_CACHE_TTL` bound how stale another worker can be.
+    """
+    return cache.get(VERSION_KEY.format(company_id), 0)
+
+
+def catalog_state(company_id=ALL_COMPANIES):
+    """
+    `(version, modified)` of a company's catalog in one cache round trip; `modified` is the Unix time
+    of the last bump, or of the first read after the cache lost it.
+    """
+    values = cache.get_many([VERSION_KEY.format(company_id), MODIFIED_KEY.format(company_id)])
+    modified = values.get(MODIFIED_KEY.format(company_id))
+    if modified is None:
+        # Not bumped since the cache was cleared; anything older is already stale
+        modified = time.time()
+        if not cache.add(MODIFIED_KEY.format(company_id), modified, timeout=None):
+            modified = cache.get(MODIFIED_KEY.format(company_id), modified)
+    return values.get(VERSION_KEY.format(company_id), 0), modified
+
+
+def bump_catalog_version(*company_ids):
+    """
+    Invalidate cached catalog reads for the given companies and for the unfiltered catalog.
+    """
+    scopes = {ALL_COMPANIES, *company_ids}
+    cache.set_many({MODIFIED_KEY.format(scope): time.time() for scope in scopes}, timeout=None)
+    for scope in scopes:
+        key = VERSION_KEY.format(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # First bump for this scope, or the key was evicted
+            if not cache.add(key, 1, timeout=None):
+                cache.incr(key)
+
+
+class CatalogCache:
+    """
+    Bounded, per-process LRU store for serialized catalog responses.
+
+    Keys carry the catalog version they were built against, so a bump makes old entries
+    unreachable and they age out through LRU eviction instead of being deleted. Entries also
+    expire after `ttl` seconds, which caps staleness when a bump made in another process isn't
+    visible here.
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+            }
+
+
+catalog_cache = CatalogCache(getattr(settings, 'CATALOG_CACHE_MAX_ENTRIES', 1024), getattr(settings, 'CATALOG_CACHE_TTL', 30))
+
+
+class UserCache:
+    """
+    Short-lived, per-process store of full CustomUser rows keyed by id, for requests whose token
+    doesn't carry enough claims or that touch a field outside them. Entries expire after `ttl`
+    seconds, so profile and role changes show up within that window.
+    """
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        """
+        The user row for `user_id`, loaded at most once per `ttl`. Raises CustomUser.DoesNotExist.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(user_id)
+                return entry[1]
+
+        user = get_user_model().objects.get(pk=user_id)
+        with self._lock:
+            self._entries[user_id] = (now + self.ttl, user)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return user
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserCache(getattr(settings, 'USER_CACHE_TTL', 60), getattr(settings, 'USER_CACHE_MAX_ENTRIES', 10000))
@@ -0,0 +1,43 @@
+import hashlib
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+
+def make_etag(*parts):
+    """
+    Strong ETag over the values a response was built from.
+    """
+    return '"%s"' % hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+def is_conditional(request):
+    return 'HTTP_IF_NONE_MATCH' in request.META or 'HTTP_IF_MODIFIED_SINCE' in request.META
+
+
+def not_modified(request, etag, last_modified=None):
+    """
+    A `304 Not Modified` response when the request's `If-None-Match`/`If-Modified-Since` still match, else None.
+    `last_modified` is a datetime or a Unix timestamp.
+    """
+    timestamp = to_timestamp(last_modified)
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
+
+
+def set_validators(response, etag, last_modified=None):
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        timestamp = to_timestamp(last_modified)
+        if timestamp is not None:
+            response['Last-Modified'] = http_date(timestamp)
+    return response
+
+
+def to_timestamp(value):
+    if value is None:
+        return None
+    if hasattr(value, 'timestamp'):
+        return int(value.timestamp())
+    return int(value)
@@ -0,0 +1,66 @@
+from django.db.models import Case, Count, IntegerField, Value, When
+
+
+# Upper bounds of the price buckets; the last bucket is everything from the final bound up
+PRICE_BUCKETS = (10, 25, 50, 100, 250, 500, 1000)
+
+FACET_FIELDS = ('category', 'company')
+
+
+def price_bucket():
+    return Case(
+        *(When(effective_price__lt=bound, then=Value(index)) for index, bound in enumerate(PRICE_BUCKETS)),
+        default=Value(len(PRICE_BUCKETS)),
+        output_field=IntegerField(),
+    )
+
+
+def facet_rows(queryset):
+    """
+    Product counts per (category, company, price bucket) in one grouped query.
+    """
+    return list(
+        queryset.prefetch_related(None)
+        .values('category_id', 'category__name', 'company_id', 'company__name', bucket=price_bucket())
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+
+
+def count_by(rows, key, name):
+    counts = {}
+    for row in rows:
+        if row[key] is None:
+            continue
+        entry = counts.setdefault(row[key], {'id': row[key], 'name': row[name], 'count': 0})
+        entry['count'] += row['count']
+    return sorted(counts.values(), key=lambda entry: (-entry['count'], entry['name'], entry['id']))
+
+
+def product_facets(queryset, selected):
+    """
+    Facet counts for the products of `queryset` with `selected` (`{'category': id, 'company': id}`, either
+    optional) applied.
+
+    Each facet counts the products matching every selection except its own, so the other values of a
+    facet stay visible with the number of products picking them would give. All of it comes from
+    `facet_rows`, filtered in memory.
+    """
+    rows = facet_rows(queryset)
+
+    def matching(*fields):
+        return [row for row in rows if all(selected.get(field) in (None, row[f'{field}_id']) for field in fields)]
+
+    buckets = [0] * (len(PRICE_BUCKETS) + 1)
+    matched = matching(*FACET_FIELDS)
+    for row in matched:
+        buckets[row['bucket']] += row['count']
+    bounds = (0,) + PRICE_BUCKETS + (None,)
+    return {
+        'count': sum(row['count'] for row in matched),
+        'category': count_by(matching('company'), 'category_id', 'category__name'),
+        'company': count_by(matching('category'), 'company_id', 'company__name'),
+        'price': [
+            {'min': bounds[index], 'max': bounds[index + 1], 'count': count} for index, count in enumerate(buckets)
+        ],
+    }
@@ -0,0 +1,177 @@
+import asyncio
+import time
+from django.conf import settings
+from django.db.models import Max,Q
+from .models import OrderStatusEvent
+
+
+FETCH_SIZE = 1000
+
+
+def event_scope(user):
+    """
+    Filter selecting the events a user may follow: a company's staff see their company's changes,
+    customers the changes to their own orders.
+    """
+    if user.role in ('admin', 'staff') and user.company_user_id:
+        return {'company_id': user.company_user_id}
+    return {'customer_id': user.pk}
+
+
+def in_scope(event, scope):
+    return all(getattr(event, field) == value for field, value in scope.items())
+
+
+def serialize_event(event):
+    return {
+        'id': event.id,
+        'order': event.order_id,
+        'company': event.company_id,
+        'previous_status': event.previous_status,
+        'status': event.status,
+        'created_at': event.created_at.isoformat(),
+    }
+
+
+async def latest_event_id():
+    return (await OrderStatusEvent.objects.aaggregate(latest=Max('id')))['latest'] or 0
+
+
+class StatusFeedHub:
+    """
+    Per-process fan-out of the status event log to waiting subscribers.
+
+    One poller task per event loop reads new events (`id > last seen`) every
+    STATUS_FEED_POLL_INTERVAL seconds while anyone is subscribed, and keeps the newest of them in
+    memory; subscribers wait on an asyncio event and filter that buffer, so thousands of idle
+    connections cost one indexed query per interval. Subscribers resuming from a cursor older than
+    the buffer read their backlog from the database.
+
+    Ids are taken at insert but become visible at commit, so a transaction can commit after one holding
+    a higher id. Ids missing below the highest one seen are remembered as gaps and queried again on
+    every poll; events are only published up to the oldest open gap, so subscribers' cursors never pass
+    an event they haven't seen. A gap still empty after STATUS_FEED_GAP_TIMEOUT seconds belongs to a
+    rolled-back transaction and is dropped.
+    """
+
+    def __init__(self):
+        self.reset(None)
+
+    def reset(self, loop):
+        self._loop = loop
+        self._task = None
+        self._changed = asyncio.Event() if loop else None
+        self.buffer = []
+        self.floor = None  # the buffer holds every event after this id
+        self.published = None  # every event up to this id has been published
+        self.last_id = None  # highest id read from the log
+        self.gaps = {}  # id -> monotonic time it was found missing
+        self.held = {}  # id -> event read above an open gap
+        self.subscribers = 0
+
+    def options(self):
+        return (
+            getattr(settings, 'STATUS_FEED_POLL_INTERVAL', 1.0),
+            getattr(settings, 'STATUS_FEED_GAP_TIMEOUT', 5.0),
+            getattr(settings, 'STATUS_FEED_BUFFER_SIZE', 10000),
+        )
+
+    async def prepare(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # First use in this event loop (a new worker, or a new test)
+            self.reset(loop)
+        if self.last_id is None:
+            self.last_id = self.floor = self.published = await latest_event_id()
+
+    async def head(self):
+        """
+        Cursor of the newest published event, where a subscriber starting from now begins.
+        """
+        await self.prepare()
+        return self.published
+
+    async def fetch(self):
+        """
+        Read events after `last_id` and those filling open gaps; returns whether a full batch was read.
+        """
+        gap_timeout = self.options()[1]
+        visible = Q(id__gt=self.last_id)
+        if self.gaps:
+            visible |= Q(id__in=list(self.gaps))
+        events = [event async for event in OrderStatusEvent.objects.filter(visible).order_by('id')[:FETCH_SIZE]]
+
+        now = time.monotonic()
+        for event in events:
+            self.gaps.pop(event.id, None)
+            self.held[event.id] = event
+        newest = max((event.id for event in events), default=self.last_id)
+        if newest > self.last_id:
+            missing = set(range(self.last_id + 1, newest)) - self.held.keys()
+            # A jump this large is a sequence reset, not transactions in flight
+            if len(missing) <= FETCH_SIZE:
+                self.gaps.update(dict.fromkeys(missing, now))
+            self.last_id = newest
+        for gap, found in list(self.gaps.items()):
+            if now - found >= gap_timeout:
+                del self.gaps[gap]
+        return len(events) == FETCH_SIZE
+
+    def publish(self):
+        buffer_size = self.options()[2]
+        limit = min(self.gaps, default=self.last_id + 1)
+        ready = sorted(event_id for event_id in self.held if event_id < limit)
+        if ready:
+            self.buffer.extend(self.held.pop(event_id) for event_id in ready)
+            if len(self.buffer) > buffer_size:
+                self.floor = self.buffer[-buffer_size - 1].id
+                del self.buffer[:-buffer_size]
+            self._changed.set()
+            self._changed = asyncio.Event()
+        self.published = max(self.published, limit - 1)
+
+    async def poll(self):
+        interval = self.options()[0]
+        while self.subscribers:
+            full = await self.fetch()
+            self.publish()
+            if not full:
+                await asyncio.sleep(interval)
+
+    async def read(self, scope, cursor, limit):
+        if cursor >= self.floor:
+            # Only events the poller has published, so every subscriber sees the same order
+            return [event for event in self.buffer if event.id > cursor and in_scope(event, scope)][:limit]
+        return [
+            event async for event in OrderStatusEvent.objects.filter(id__gt=cursor, id__lte=self.published, **scope).order_by('id')[:limit]
+        ]
+
+    async def wait(self, scope, cursor, timeout, limit=100):
+        """
+        Up to `limit` events of `scope` after `cursor`, waiting up to `timeout` seconds for the first one.
+        """
+        await self.prepare()
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self.poll())
+        self.subscribers += 1
+        try:
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + timeout
+            while True:
+                changed = self._changed
+                events = await self.read(scope, cursor, limit)
+                remaining = deadline - loop.time()
+                if events or remaining <= 0:
+                    return events
+                try:
+                    await asyncio.wait_for(changed.wait(), remaining)
+                except asyncio.TimeoutError:
+                    return []
+        finally:
+            self.subscribers -= 1
+            if not self.subscribers and self._task:
+                self._task.cancel()
+                self._task = None
+
+
+status_feed = StatusFeedHub()
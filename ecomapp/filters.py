@@ -0,0 +1,36 @@
+import django_filters
+from rest_framework.filters import OrderingFilter
+from .models import Product
+
+
+class ProductFilter(django_filters.FilterSet):
+    """
+    Catalog filters. `min_price`/`max_price` bound the discounted price (`effective_price`, inclusive).
+    """
+    min_price = django_filters.NumberFilter(field_name='effective_price', lookup_expr='gte')
+    max_price = django_filters.NumberFilter(field_name='effective_price', lookup_expr='lte')
+
+    class Meta:
+        model = Product
+        fields = ['category', 'company']
+
+
+class ProductOrderingFilter(OrderingFilter):
+    """
+    `ordering=price` / `-price` sorts by discounted price, `id` / `-id` by age; `id` always breaks ties
+    so cursor pages stay stable. The cursor paginator reads the same ordering through `get_ordering`.
+    """
+    FIELDS = {'price': 'effective_price', 'id': 'id'}
+    ordering_fields = list(FIELDS)
+    ordering_description = 'Sort by `price` or `id`; prefix with `-` for descending.'
+
+    def get_ordering(self, request, queryset, view):
+        ordering = []
+        for term in request.query_params.get(self.ordering_param, '').split(','):
+            term = term.strip()
+            field = self.FIELDS.get(term.lstrip('-'))
+            if field and field not in (name.lstrip('-') for name in ordering):
+                ordering.append(f'-{field}' if term.startswith('-') else field)
+        if 'id' not in (name.lstrip('-') for name in ordering):
+            ordering.append('-id' if ordering and ordering[0].startswith('-') else 'id')
+        return tuple(ordering)
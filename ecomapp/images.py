@@ -0,0 +1,108 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps, features
+from .cache import bump_catalog_version
+from .models import ProductImage
+
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_SIZE = (320, 320)
+OPTIMIZED_MAX_SIZE = (1600, 1600)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'IMAGE_PROCESSING_WORKERS', 2),
+                thread_name_prefix='product-images',
+            )
+        return _executor
+
+
+def schedule_image_processing(image_ids):
+    """
+    Queue variant generation for freshly stored ProductImage rows once the surrounding transaction
+    commits, so the request only pays for writing the originals.
+    """
+    image_ids = list(image_ids)
+    if not image_ids:
+        return
+
+    def submit():
+        executor = get_executor()
+        for image_id in image_ids:
+            executor.submit(run_in_worker, image_id)
+
+    transaction.on_commit(submit)
+
+
+def run_in_worker(image_id):
+    try:
+        process_product_image(image_id)
+    except Exception:
+        logger.exception('Processing product image %s failed', image_id)
+        ProductImage.objects.filter(pk=image_id).update(processing_status='failed')
+    finally:
+        # Worker threads hold their own connection; don't leak it between jobs
+        close_old_connections()
+
+
+def output_format():
+    return ('WEBP', 'webp') if features.check('webp') else ('JPEG', 'jpg')
+
+
+def encode(image, size, crop):
+    image_format, extension = output_format()
+    if crop:
+        image = ImageOps.fit(image, size, Image.LANCZOS)
+    else:
+        image = image.copy()
+        image.thumbnail(size, Image.LANCZOS)
+
+    if image_format == 'JPEG' or image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if image_format == 'WEBP' and 'A' in image.getbands() else 'RGB')
+
+    buffer = BytesIO()
+    if image_format == 'WEBP':
+        image.save(buffer, image_format, quality=80, method=4)
+    else:
+        image.save(buffer, image_format, quality=80, optimize=True, progressive=True)
+    return ContentFile(buffer.getvalue()), extension
+
+
+def process_product_image(image_id):
+    """
+    Generate the fixed-size thumbnail and the compressed display variant of one ProductImage.
+    """
+    product_image = ProductImage.objects.select_related('product').get(pk=image_id)
+
+    with product_image.image.open('rb') as original:
+        image = Image.open(original)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+
+    stem = os.path.splitext(os.path.basename(product_image.image.name))[0]
+    thumbnail, extension = encode(image, THUMBNAIL_SIZE, crop=True)
+    product_image.thumbnail.save(f'{stem}.{extension}', thumbnail, save=False)
+    optimized, extension = encode(image, OPTIMIZED_MAX_SIZE, crop=False)
+    product_image.optimized.save(f'{stem}.{extension}', optimized, save=False)
+
+    ProductImage.objects.filter(pk=image_id).update(
+        thumbnail=product_image.thumbnail.name,
+        optimized=product_image.optimized.name,
+        processing_status='done',
+    )
+    # Cached catalog responses embed image URLs
+    bump_catalog_version(product_image.product.company_id)
@@ -0,0 +1,91 @@
+from functools import reduce
+from operator import or_
+from django.db import connection, transaction
+from django.db.models import Case, F, PositiveIntegerField, Q, When
+from rest_framework import serializers
+from .models import Product
+
+
+BATCH_SIZE = 500
+
+
+class InsufficientStock(serializers.ValidationError):
+    def __init__(self, available):
+        super().__init__({'order_items': [
+            f'Only {quantity} left of product {product_id}.' for product_id, quantity in sorted(available.items())
+        ]})
+        self.available = available
+
+
+class _Short(Exception):
+    pass
+
+
+def batches(quantities):
+    items = sorted(quantities.items())
+    for start in range(0, len(items), BATCH_SIZE):
+        yield dict(items[start:start + BATCH_SIZE])
+
+
+def reserve_stock(quantities):
+    """
+    Take `{product_id: quantity}` out of stock, all or nothing.
+
+    Each batch of products is one conditional UPDATE (`... WHERE (id = 1 AND Quantity >= 2) OR ...`), so
+    checking and decrementing happen in the same statement and concurrent orders can never oversell.
+    Multi-product batches first lock their rows in id order so two orders sharing products cannot
+    deadlock. Raises InsufficientStock, with what is left of each short product, when any line can't be met.
+    """
+    quantities = {product_id: quantity for product_id, quantity in quantities.items() if quantity > 0}
+    if not quantities:
+        return
+
+    try:
+        with transaction.atomic():
+            for batch in batches(quantities):
+                if len(batch) > 1 and connection.features.has_select_for_update:
+                    list(Product.objects.filter(pk__in=batch).order_by('pk').select_for_update().values_list('pk', flat=True))
+                updated = Product.objects.filter(
+                    reduce(or_, (Q(pk=product_id, Quantity__gte=quantity) for product_id, quantity in batch.items()))
+                ).update(Quantity=Case(
+                    *(When(pk=product_id, then=F('Quantity') - quantity) for product_id, quantity in batch.items()),
+                    default=F('Quantity'),
+                    output_field=PositiveIntegerField(),
+                ))
+                if updated != len(batch):
+                    raise _Short
+    except _Short:
+        available = dict(Product.objects.filter(pk__in=quantities).values_list('pk', 'Quantity'))
+        raise InsufficientStock({
+            product_id: available.get(product_id, 0)
+            for product_id, quantity in quantities.items() if available.get(product_id, 0) < quantity
+        })
+
+
+def release_stock(quantities):
+    """
+    Put `{product_id: quantity}` back into stock, one UPDATE per batch.
+    """
+    quantities = {product_id: quantity for product_id, quantity in quantities.items() if quantity > 0}
+    for batch in batches(quantities):
+        Product.objects.filter(pk__in=batch).update(Quantity=Case(
+            *(When(pk=product_id, then=F('Quantity') + quantity) for product_id, quantity in batch.items()),
+            default=F('Quantity'),
+            output_field=PositiveIntegerField(),
+        ))
+
+
+def adjust_stock(previous, current):
+    """
+    Reserve or release the difference between two `{product_id: quantity}` maps, e.g. before and after an order edit.
+    """
+    release_stock({product_id: quantity - current.get(product_id, 0) for product_id, quantity in previous.items()})
+    reserve_stock({product_id: quantity - previous.get(product_id, 0) for product_id, quantity in current.items()})
+
+
+def product_quantities(items):
+    quantities = {}
+    for item in items:
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+    return quantities
+
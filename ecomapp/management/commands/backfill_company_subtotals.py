@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+from ecomapp.models import Order,OrderItem,OrderCompanyStatus
+
+
+class Command(BaseCommand):
+    help = 'Recompute OrderCompanyStatus.subtotal and item_count from order items, creating missing status rows.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Orders processed per transaction.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        order_ids = Order.objects.order_by('id').values_list('id', flat=True)
+        updated = created = 0
+
+        batch = []
+        for order_id in order_ids.iterator(chunk_size=batch_size):
+            batch.append(order_id)
+            if len(batch) == batch_size:
+                counts = self.backfill(batch)
+                updated, created, batch = updated + counts[0], created + counts[1], []
+        if batch:
+            counts = self.backfill(batch)
+            updated, created = updated + counts[0], created + counts[1]
+
+        self.stdout.write(self.style.SUCCESS(f'Updated {updated} and created {created} order company statuses.'))
+
+    @transaction.atomic
+    def backfill(self, order_ids):
+        now = timezone.now()
+        totals = {
+            (row['order_id'], row['product__company_id']): (row['subtotal'], row['item_count'])
+            for row in OrderItem.objects.filter(order_id__in=order_ids, product__company__isnull=False)
+            .values('order_id', 'product__company_id')
+            .annotate(subtotal=Sum('amount'), item_count=Count('id'))
+            .order_by()
+        }
+
+        changed = []
+        for order_status in OrderCompanyStatus.objects.filter(order_id__in=order_ids).select_for_update():
+            subtotal, item_count = totals.pop((order_status.order_id, order_status.company_id), (0, 0))
+            if (order_status.subtotal, order_status.item_count) != (subtotal, item_count):
+                order_status.subtotal, order_status.item_count, order_status.last_updated = subtotal, item_count, now
+                changed.append(order_status)
+        OrderCompanyStatus.objects.bulk_update(changed, ['subtotal', 'item_count', 'last_updated'])
+
+        OrderCompanyStatus.objects.bulk_create([
+            OrderCompanyStatus(order_id=order_id, company_id=company_id, status='pending', last_updated=now, subtotal=subtotal, item_count=item_count)
+            for (order_id, company_id), (subtotal, item_count) in totals.items()
+        ])
+        return len(changed), len(totals)
@@ -0,0 +1,120 @@
+import asyncio
+import datetime
+import statistics
+import time
+import uuid
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import AsyncClient, override_settings
+from ecomapp.authentication import tokens_for_user
+from ecomapp.models import CustomUser,Company,Category,Product,Order,OrderItem,Cart,CartItem
+from ecomapp.orders import sync_company_statuses
+
+
+# (name, sync path, async path, caller); products are read as the company admin so neither side hits the
+# catalog cache. Customers have no sync order read, so orders are measured on the async side only
+ENDPOINTS = [
+    ('product-list', '/product/', '/async/product/', 'owner'),
+    ('product-detail', '/product/{product}/', '/async/product/{product}/', 'owner'),
+    ('cart', '/cart/summary/', '/async/cart/', 'customer'),
+    ('orders', None, '/async/order/', 'customer'),
+]
+
+
+# The test client runs the app in this process, where sync views and the ORM calls of async views all go
+# through asgiref's single thread-sensitive executor, so database work is serialized on both sides
+LIMITATION = (
+    'Measured in-process through AsyncClient: ORM calls of both variants share one thread, so these numbers '
+    'compare request overhead, not concurrent database throughput. Load-test a real ASGI server '
+    '(e.g. uvicorn) for that.'
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare throughput of the sync DRF read endpoints and their async versions under concurrent '
+        'connections, both served through the ASGI handler. Seed data is committed before measuring and '
+        'deleted afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=50, help='Requests in flight at once.')
+        parser.add_argument('--requests', type=int, default=500, help='Requests per endpoint and variant.')
+        parser.add_argument('--products', type=int, default=200)
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1 or options['requests'] < 1:
+            raise CommandError('--concurrency and --requests must be positive.')
+        rows = []
+        unlimited = {role: '1000000/s' for role in ['anon', 'customer', 'staff', 'admin', 'company']}
+        # Committed up front so requests read it outside any transaction, like a live server would
+        with transaction.atomic():
+            users, category, headers, product = self.seed(options['products'])
+        try:
+            with override_settings(ALLOWED_HOSTS=['testserver'], TOKEN_BUCKET_RATES=unlimited):
+                for name, sync_path, async_path, caller in ENDPOINTS:
+                    for variant, path in [('sync', sync_path), ('async', async_path)]:
+                        if path is None:
+                            continue
+                        url = path.format(product=product.id)
+                        rows.append((name, variant) + async_to_sync(self.measure)(url, headers[caller], options['concurrency'], options['requests']))
+        finally:
+            # Companies, products, carts and orders cascade from their users
+            CustomUser.objects.filter(pk__in=[user.pk for user in users]).delete()
+            category.delete()
+
+        self.stdout.write(f"{'endpoint':<15} {'view':<6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'errors':>7}")
+        for name, variant, throughput, p50, p95, errors in rows:
+            self.stdout.write(f'{name:<15} {variant:<6} {throughput:>8.0f} {p50:>8.1f} {p95:>8.1f} {errors:>7}')
+        self.stdout.write(LIMITATION)
+
+    def seed(self, count):
+        run = uuid.uuid4().hex[:8]
+        owner = CustomUser.objects.create_user(f'bench-owner-{run}', email=f'bench-owner-{run}@example.invalid', role='admin')
+        company = Company.objects.create(name=f'bench {run}', owner=owner)
+        owner.company_user = company
+        owner.save()
+        category = Category.objects.create(name=f'bench {run}')
+        customer = CustomUser.objects.create_user(f'bench-customer-{run}', email=f'bench-customer-{run}@example.invalid')
+        products = Product.objects.bulk_create([
+            Product(Product_name=f'bench {i}', Quantity=10**6, price=9.99, Description='bench',
+                    company=company, category=category, Created_by=owner)
+            for i in range(count)
+        ])
+
+        cart = Cart.objects.create(user=customer)
+        CartItem.objects.bulk_create([
+            CartItem(cart=cart, product=product, quantity=1, total_price=CartItem.compute_total_price(product, 1)) for product in products[:20]
+        ])
+        for _ in range(20):
+            order = Order.objects.create(user=customer, location='bench', time_of_delivery=datetime.time(12, 0))
+            items = OrderItem.objects.bulk_create([
+                OrderItem(order=order, product=product, quantity=1, amount=OrderItem.compute_amount(product, 1)) for product in products[:5]
+            ])
+            sync_company_statuses(order, items, statuses=[])
+
+        headers = {
+            name: {'Authorization': f'Bearer {tokens_for_user(user).access_token}'}
+            for name, user in [('owner', owner), ('customer', customer)]
+        }
+        return [owner, customer], category, headers, products[0]
+
+    async def measure(self, url, headers, concurrency, total):
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+        timings, errors = [], 0
+
+        async def fetch():
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.get(url, headers=headers)
+                timings.append((time.perf_counter() - start) * 1000)
+                errors += response.status_code != 200
+
+        start = time.perf_counter()
+        await asyncio.gather(*(fetch() for _ in range(total)))
+        elapsed = time.perf_counter() - start
+        timings.sort()
+        return total / elapsed, statistics.median(timings), timings[int(len(timings) * 0.95) - 1], errors
@@ -0,0 +1,83 @@
+import datetime
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection
+from ecomapp.inventory import InsufficientStock
+from ecomapp.models import CustomUser,Company,Category,Product,Order
+from ecomapp.orders import place_order
+
+
+class Command(BaseCommand):
+    help = (
+        'Place orders for one SKU from many threads at once and check that stock is never oversold. '
+        'Needs a database that allows concurrent writers (PostgreSQL); the seeded rows are deleted afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=32)
+        parser.add_argument('--orders-per-thread', type=int, default=10)
+        parser.add_argument('--stock', type=int, default=200, help='Starting stock of the contended product.')
+        parser.add_argument('--quantity', type=int, default=1, help='Units per order.')
+
+    def handle(self, *args, **options):
+        threads, per_thread, stock, quantity = options['threads'], options['orders_per_thread'], options['stock'], options['quantity']
+        owner = CustomUser.objects.create_user('contention-owner', email='contention-owner@example.invalid', role='admin')
+        try:
+            company = Company.objects.create(name='contention', owner=owner)
+            product = Product.objects.create(
+                Product_name='contended', Quantity=stock, price=10, Description='contended', company=company,
+                category=Category.objects.get_or_create(name='contention')[0], Created_by=owner,
+            )
+            customers = CustomUser.objects.bulk_create([
+                CustomUser(email=f'contention-{i}@example.invalid', username=f'contention-{i}') for i in range(threads)
+            ])
+            barrier = threading.Barrier(threads)
+
+            def worker(customer):
+                placed = rejected = failed = 0
+                latencies = []
+                barrier.wait()
+                try:
+                    for _ in range(per_thread):
+                        start = time.perf_counter()
+                        try:
+                            place_order(
+                                {'user': customer, 'location': 'contention', 'time_of_delivery': datetime.time(12, 0)},
+                                [{'product': product, 'quantity': quantity}],
+                            )
+                            placed += 1
+                        except InsufficientStock:
+                            rejected += 1
+                        except DatabaseError:
+                            failed += 1
+                        latencies.append((time.perf_counter() - start) * 1000)
+                finally:
+                    connection.close()
+                return placed, rejected, failed, latencies
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                results = list(pool.map(worker, customers))
+            elapsed = time.perf_counter() - start
+
+            placed = sum(result[0] for result in results)
+            rejected = sum(result[1] for result in results)
+            failed = sum(result[2] for result in results)
+            latencies = sorted(latency for result in results for latency in result[3])
+            left = Product.objects.get(pk=product.pk).Quantity
+            percentiles = statistics.quantiles(latencies, n=100, method='inclusive')
+
+            self.stdout.write(f'threads={threads} attempts={threads * per_thread} placed={placed} rejected={rejected} errors={failed}')
+            self.stdout.write(f'stock {stock} -> {left}; throughput {(placed + rejected) / elapsed:.1f} orders/s; '
+                              f'latency p50 {percentiles[49]:.1f} ms, p95 {percentiles[94]:.1f} ms, p99 {percentiles[98]:.1f} ms')
+            if left < 0 or placed * quantity + left != stock:
+                raise CommandError('Stock accounting is inconsistent: the product was oversold.')
+            if placed != min(threads * per_thread - failed, stock // quantity):
+                raise CommandError('Orders were rejected while stock was still available.')
+            self.stdout.write(self.style.SUCCESS('No overselling.'))
+        finally:
+            Order.objects.filter(user__email__startswith='contention-').delete()
+            CustomUser.objects.filter(email__startswith='contention-').delete()
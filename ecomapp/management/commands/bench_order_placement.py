@@ -0,0 +1,88 @@
+import datetime
+import statistics
+import time
+from types import SimpleNamespace
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from ecomapp.models import CustomUser,Company,Category,Product,Order,OrderItem,OrderCompanyStatus
+from ecomapp.serializers import UserOrderSerializer
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Compare query counts and latency of per-item and bulk order placement. All data is rolled back.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000], help='Order line counts to measure.')
+        parser.add_argument('--repeat', type=int, default=5, help='Orders placed per size and path.')
+
+    def handle(self, *args, **options):
+        sizes = options['sizes']
+        try:
+            with transaction.atomic():
+                customer, products = self.seed(max(sizes))
+                rows = []
+                for size in sizes:
+                    for name, place in [('per-item', self.place_per_item), ('bulk', self.place_bulk)]:
+                        queries, timings = self.measure(place, customer, products[:size], options['repeat'])
+                        rows.append((size, name, queries, statistics.median(timings), max(timings)))
+                raise Rollback
+        except Rollback:
+            pass
+
+        self.stdout.write(f"{'lines':>6} {'path':<9} {'queries':>8} {'median ms':>10} {'max ms':>9}")
+        for size, name, queries, median, worst in rows:
+            self.stdout.write(f'{size:>6} {name:<9} {queries:>8} {median:>10.1f} {worst:>9.1f}')
+
+    def seed(self, count):
+        owner = CustomUser.objects.create_user('bench-owner', email='bench-owner@example.invalid', role='admin')
+        company = Company.objects.create(name='bench', owner=owner)
+        category = Category.objects.create(name='bench')
+        customer = CustomUser.objects.create_user('bench-customer', email='bench-customer@example.invalid')
+        products = Product.objects.bulk_create([
+            Product(Product_name=f'bench {i}', Quantity=10**6, price=9.99, discount=10, Description='bench',
+                    company=company, category=category, Created_by=owner)
+            for i in range(count)
+        ])
+        return customer, products
+
+    def measure(self, place, customer, products, repeat):
+        timings = []
+        for _ in range(repeat):
+            queries = []
+
+            def count(execute, sql, params, many, context):
+                queries.append(sql)
+                return execute(sql, params, many, context)
+
+            with connection.execute_wrapper(count):
+                start = time.perf_counter()
+                place(customer, products)
+                timings.append((time.perf_counter() - start) * 1000)
+        return len(queries), timings
+
+    def place_per_item(self, customer, products):
+        # The placement path before bulk inserts: one product lookup and one save per line,
+        # a lazy company load per product, then a re-read of the items to total the order
+        lines = [Product.objects.get(pk=product.pk) for product in products]
+        order = Order.objects.create(user=customer, location='bench', time_of_delivery=datetime.time(12, 0))
+        for product in lines:
+            OrderItem(order=order, product=product, quantity=2).save()
+        companies = {product.company for product in lines}
+        OrderCompanyStatus.objects.bulk_create([OrderCompanyStatus(order=order, company=company) for company in companies])
+        order.calculate_total_price()
+
+    def place_bulk(self, customer, products):
+        serializer = UserOrderSerializer(
+            data={
+                'location': 'bench',
+                'time_of_delivery': '12:00',
+                'order_items': [{'product': product.pk, 'quantity': 2} for product in products],
+            },
+            context={'request': SimpleNamespace(user=customer)},
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
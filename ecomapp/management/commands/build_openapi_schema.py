@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from ecomapp.openapi import build_schema
+
+
+class Command(BaseCommand):
+    help = 'Generate the OpenAPI schema once and write it to OPENAPI_SCHEMA_PATH; run at deploy.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=None, help='File to write instead of OPENAPI_SCHEMA_PATH.')
+
+    def handle(self, *args, **options):
+        path = options['output'] or settings.OPENAPI_SCHEMA_PATH
+        body = build_schema()
+        with open(path, 'wb') as schema_file:
+            schema_file.write(body)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {len(body)} bytes of OpenAPI schema to {path}.'))
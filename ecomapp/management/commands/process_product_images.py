@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from ecomapp.images import process_product_image
+from ecomapp.models import ProductImage
+
+
+class Command(BaseCommand):
+    help = 'Generate thumbnails and compressed variants for product images that do not have them yet.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retry-failed', action='store_true', help='Also reprocess images whose processing failed.')
+
+    def handle(self, *args, **options):
+        statuses = ['pending', 'failed'] if options['retry_failed'] else ['pending']
+        done = failed = 0
+        for image_id in ProductImage.objects.filter(processing_status__in=statuses).values_list('id', flat=True).iterator():
+            try:
+                process_product_image(image_id)
+                done += 1
+            except Exception as exc:
+                ProductImage.objects.filter(pk=image_id).update(processing_status='failed')
+                self.stderr.write(f'Image {image_id}: {exc}')
+                failed += 1
+        self.stdout.write(self.style.SUCCESS(f'Processed {done} images, {failed} failed.'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from ecomapp.rollups import rebuild_sales
+
+
+class Command(BaseCommand):
+    help = 'Recompute the SalesRollup rows from order items, for every company or the given ones.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', type=int, action='append', dest='companies', help='Company id to rebuild; repeatable.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            written = rebuild_sales(options['companies'])
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} sales rollup rows.'))
@@ -0,0 +1,26 @@
+import time
+from django.core.management.base import BaseCommand
+from ecomapp.outbox import send_batch
+
+
+class Command(BaseCommand):
+    help = 'Send queued outbox emails in batches, one SMTP connection per batch, retrying failures with backoff.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--max-attempts', type=int, default=None, help='Defaults to OUTBOX_MAX_ATTEMPTS.')
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new emails instead of exiting once the queue is drained.')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds to wait between polls with --loop.')
+
+    def handle(self, *args, **options):
+        sent = failed = 0
+        while True:
+            claimed, batch_sent, batch_failed = send_batch(options['batch_size'], options['max_attempts'])
+            sent, failed = sent + batch_sent, failed + batch_failed
+            if claimed < options['batch_size']:
+                # Nothing more is due right now
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(f'Sent {sent} emails; {failed} gave up.'))
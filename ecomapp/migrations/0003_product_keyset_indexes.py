@@ -0,0 +1,21 @@
+# Generated by Django 5.0.7 on 2026-10-18 18:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecomapp', '0002_remove_order_company_ordercompanystatus_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'id'], name='product_category_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['company', 'id'], name='product_company_id_idx'),
+        ),
+    ]
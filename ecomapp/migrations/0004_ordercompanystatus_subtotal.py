@@ -0,0 +1,23 @@
+# Generated by Django 5.0.7 on 2026-10-18 18:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecomapp', '0003_product_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ordercompanystatus',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='ordercompanystatus',
+            name='subtotal',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+    ]
@@ -0,0 +1,15 @@
+from django.db import migrations
+
+from ._product_search import install_search_index, remove_search_index
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecomapp', '0004_ordercompanystatus_subtotal'),
+    ]
+
+    operations = [
+        # search_vector (PostgreSQL) and ecomapp_product_fts (SQLite) are maintained by the database and not part of the model
+        migrations.RunPython(install_search_index, remove_search_index),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.0.7 on 2026-10-18 18:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecomapp', '0005_product_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', '-date_ordered'], name='order_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ordercompanystatus',
+            index=models.Index(fields=['company', 'status', '-last_updated', 'order'], name='ocs_company_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['company', 'category', 'id'], name='product_company_category_idx'),
+        ),
+    ]
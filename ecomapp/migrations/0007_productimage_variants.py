@@ -0,0 +1,28 @@
+# Generated by Django 5.0.7 on 2026-10-18 18:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecomapp', '0006_hot_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productimage',
+            name='optimized',
+            field=models.ImageField(blank=True, null=True, upload_to='products/optimized'),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='processing_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='thumbnail',
+            field=models.ImageField(blank=True, null=True, upload_to='products/thumbnails'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.0.7 on 2026-10-18 19:16
+
+import django.db.models.expressions
+from django.db import migrations, models
+
+from ._product_search import install_search_index
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecomapp', '0011_salesrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='effective_price',
+            field=models.GeneratedField(db_persist=True, expression=models.Case(models.When(discount__gt=0, then=django.db.models.expressions.CombinedExpression(models.F('price'), '*', django.db.models.expressions.CombinedExpression(models.Value(1.0), '-', django.db.models.expressions.CombinedExpression(models.F('discount'), '/', models.Value(100.0))))), default=models.F('price')), output_field=models.FloatField()),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['effective_price', 'id'], name='product_price_id_idx'),
+        ),
+        # SQLite adds the stored column by rebuilding ecomapp_product, which drops the search triggers
+        migrations.RunPython(install_search_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,74 @@
+"""
+Product search index DDL, frozen for the migrations that install it (0005, and 0012 after SQLite
+rebuilds ecomapp_product). Migrations must keep behaving as they did when written, so don't edit this
+module: a changed index gets new statements in a new migration.
+
+The leading underscore keeps Django's migration loader from treating this module as a migration.
+"""
+
+# Product_name outranks Description on every backend
+POSTGRES_SEARCH_VECTOR = (
+    "setweight(to_tsvector('english'::regconfig, coalesce(\"Product_name\", '')), 'A') || "
+    "setweight(to_tsvector('english'::regconfig, coalesce(\"Description\", '')), 'B')"
+)
+
+POSTGRES_INSTALL = [
+    f'ALTER TABLE ecomapp_product ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ({POSTGRES_SEARCH_VECTOR}) STORED',
+    'CREATE INDEX product_search_vector_idx ON ecomapp_product USING GIN (search_vector)',
+]
+
+POSTGRES_REMOVE = [
+    'DROP INDEX IF EXISTS product_search_vector_idx',
+    'ALTER TABLE ecomapp_product DROP COLUMN IF EXISTS search_vector',
+]
+
+SQLITE_INSTALL = [
+    'CREATE VIRTUAL TABLE IF NOT EXISTS ecomapp_product_fts USING fts5('
+    '"Product_name", "Description", content=\'ecomapp_product\', content_rowid=\'id\')',
+    'CREATE TRIGGER IF NOT EXISTS ecomapp_product_fts_ai AFTER INSERT ON ecomapp_product BEGIN '
+    'INSERT INTO ecomapp_product_fts(rowid, "Product_name", "Description") VALUES (new.id, new."Product_name", new."Description"); '
+    'END',
+    'CREATE TRIGGER IF NOT EXISTS ecomapp_product_fts_ad AFTER DELETE ON ecomapp_product BEGIN '
+    'INSERT INTO ecomapp_product_fts(ecomapp_product_fts, rowid, "Product_name", "Description") VALUES (\'delete\', old.id, old."Product_name", old."Description"); '
+    'END',
+    'CREATE TRIGGER IF NOT EXISTS ecomapp_product_fts_au AFTER UPDATE ON ecomapp_product BEGIN '
+    'INSERT INTO ecomapp_product_fts(ecomapp_product_fts, rowid, "Product_name", "Description") VALUES (\'delete\', old.id, old."Product_name", old."Description"); '
+    'INSERT INTO ecomapp_product_fts(rowid, "Product_name", "Description") VALUES (new.id, new."Product_name", new."Description"); '
+    'END',
+    # Index rows that already exist, and resync after SQLite rebuilt the product table
+    "INSERT INTO ecomapp_product_fts(ecomapp_product_fts) VALUES ('rebuild')",
+]
+
+SQLITE_REMOVE = [
+    'DROP TRIGGER IF EXISTS ecomapp_product_fts_ai',
+    'DROP TRIGGER IF EXISTS ecomapp_product_fts_ad',
+    'DROP TRIGGER IF EXISTS ecomapp_product_fts_au',
+    'DROP TABLE IF EXISTS ecomapp_product_fts',
+]
+
+
+def install_search_index(apps, schema_editor):
+    """
+    Migration step creating the backend's product search index.
+
+    SQLite drops triggers when a migration rebuilds ecomapp_product, so migrations that alter the
+    product table on SQLite run this again; every statement is safe to repeat.
+    """
+    vendor = schema_editor.connection.vendor
+    statements = {'postgresql': POSTGRES_INSTALL, 'sqlite': SQLITE_INSTALL}.get(vendor, [])
+    if vendor == 'postgresql' and has_search_vector(schema_editor.connection):
+        statements = []
+    for statement in statements:
+        schema_editor.execute(statement, params=None)
+
+
+def remove_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for statement in {'postgresql': POSTGRES_REMOVE, 'sqlite': SQLITE_REMOVE}.get(vendor, []):
+        schema_editor.execute(statement, params=None)
+
+
+def has_search_vector(connection):
+    with connection.cursor() as cursor:
+        columns = connection.introspection.get_table_description(cursor, 'ecomapp_product')
+    return any(column.name == 'search_vector' for column in columns)
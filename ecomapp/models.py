@@ -1,5 +1,7 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import AbstractUser
+from decimal import Decimal
 
 
 class CustomUser(AbstractUser):
@@ -18,6 +20,26 @@ class CustomUser(AbstractUser):
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = []    
 
+
+
+class ClaimsUser(CustomUser):
+    """
+    A CustomUser built from access token claims instead of a database row (see ecomapp/authentication.py).
+
+    Only the claimed fields are loaded; reading any other field fills it from the per-process user cache,
+    so the row is fetched at most once per cache TTL rather than on every request.
+    """
+    class Meta:
+        proxy = True
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        if not fields:
+            return super().refresh_from_db(using=using, fields=fields, **kwargs)
+        from .cache import user_cache
+        user = user_cache.get(self.pk)
+        for field in fields:
+            setattr(self, field, getattr(user, field))
+
         
 class Company(models.Model):
     name = models.CharField(max_length=255,unique=False, blank=True, null=True)
@@ -43,6 +65,26 @@ class Product(models.Model):
     company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='products', null=True)
     category=models.ForeignKey(Category, on_delete=models.CASCADE)
     Created_by = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='created_products')
+    # get_discounted_price() computed by the database, so price filters and sorting run in SQL
+    effective_price = models.GeneratedField(
+        expression=models.Case(
+            models.When(discount__gt=0, then=models.F('price') * (models.Value(1.0) - models.F('discount') / models.Value(100.0))),
+            default=models.F('price'),
+        ),
+        output_field=models.FloatField(),
+        db_persist=True,
+    )
+
+    class Meta:
+        indexes = [
+            # keyset pagination: WHERE <filter> AND id > cursor ORDER BY id
+            models.Index(fields=['category', 'id'], name='product_category_id_idx'),
+            models.Index(fields=['company', 'id'], name='product_company_id_idx'),
+            # company catalog narrowed to one category, in page order
+            models.Index(fields=['company', 'category', 'id'], name='product_company_category_idx'),
+            # price range filters and price-ordered pages: ORDER BY effective_price, id
+            models.Index(fields=['effective_price', 'id'], name='product_price_id_idx'),
+        ]
 
     def get_discounted_price(self):
         if self.discount > 0:
@@ -51,10 +93,24 @@ class Product(models.Model):
     
 
 class ProductImage(models.Model):
+    PROCESSING_CHOICES = (
+        ('pending', 'Pending'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    )
     product = models.ForeignKey(Product, on_delete=models.CASCADE,related_name='images')
     image = models.ImageField(upload_to="products")
+    # Variants generated off-request by ecomapp/images.py
+    thumbnail = models.ImageField(upload_to="products/thumbnails", blank=True, null=True)
+    optimized = models.ImageField(upload_to="products/optimized", blank=True, null=True)
+    processing_status = models.CharField(max_length=10, choices=PROCESSING_CHOICES, default='pending')
+
+
 
 
+def line_price(field, product, quantity):
+    # Round exactly as the decimal column stores it, so totals summed in memory match the database
+    return field.to_python(quantity * product.get_discounted_price()).quantize(Decimal('0.01'), context=field.context)
 
 
 class Order(models.Model):
@@ -65,6 +121,12 @@ class Order(models.Model):
     time_of_delivery = models.TimeField()
     total_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     companies = models.ManyToManyField(Company, through='OrderCompanyStatus')
+
+    class Meta:
+        indexes = [
+            # a customer's orders, newest first
+            models.Index(fields=['user', '-date_ordered'], name='order_user_date_idx'),
+        ]
     
 
     def calculate_total_price(self):
@@ -81,9 +143,13 @@ class OrderItem(models.Model):
 
     def save(self, *args, **kwargs):
         
-        self.amount = self.quantity * self.product.get_discounted_price()
+        self.amount = self.compute_amount(self.product, self.quantity)
         super(OrderItem, self).save(*args, **kwargs)
 
+    @classmethod
+    def compute_amount(cls, product, quantity):
+        return line_price(cls._meta.get_field('amount'), product, quantity)
+
 
 class OrderCompanyStatus(models.Model):
     STATUS_CHOICES = [
@@ -92,20 +158,54 @@ class OrderCompanyStatus(models.Model):
         ('delivered', 'Delivered'),
         ('canceled', 'Canceled'),
     ]
+    # Statuses each status may move to; a canceled order can be reopened
+    TRANSITIONS = {
+        'pending': {'shipped', 'canceled'},
+        'shipped': {'delivered'},
+        'delivered': set(),
+        'canceled': {'pending'},
+    }
 
     order = models.ForeignKey(Order, on_delete=models.CASCADE)
     company = models.ForeignKey(Company, on_delete=models.CASCADE)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
     last_updated = models.DateTimeField(auto_now=True)
+    # Company's share of the order, kept in step with its order items (see ecomapp/orders.py)
+    subtotal = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    item_count = models.PositiveIntegerField(default=0)
 
     class Meta:
         unique_together = ('order', 'company')  # Ensures one status per company per order
+        indexes = [
+            # a company's orders by status, most recently changed first; order_id makes it covering for the order list
+            models.Index(fields=['company', 'status', '-last_updated', 'order'], name='ocs_company_status_idx'),
+        ]
 
     def __str__(self):
         return f"Order {self.order.id} - Company {self.company.name} - Status {self.status}"
 
 
 
+class OrderStatusEvent(models.Model):
+    """
+    Append-only log of OrderCompanyStatus changes; `id` is the feed cursor (see ecomapp/feed.py).
+    """
+    id = models.BigAutoField(primary_key=True)
+    order = models.ForeignKey(Order, on_delete=models.CASCADE)
+    company = models.ForeignKey(Company, on_delete=models.CASCADE)
+    customer = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    previous_status = models.CharField(max_length=10, choices=OrderCompanyStatus.STATUS_CHOICES)
+    status = models.CharField(max_length=10, choices=OrderCompanyStatus.STATUS_CHOICES)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # resuming a subscriber's feed: WHERE customer/company = ? AND id > cursor ORDER BY id
+            models.Index(fields=['customer', 'id'], name='status_event_customer_idx'),
+            models.Index(fields=['company', 'id'], name='status_event_company_idx'),
+        ]
+
+
 class Cart(models.Model):
     user = models.OneToOneField(CustomUser, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -114,7 +214,7 @@ class Cart(models.Model):
         return f"Cart {self.id} for {self.user.first_name}"
 
     def get_total_price(self):
-        return sum(item.get_total_price() for item in self.cart_items.all())
+        return self.cart_items.aggregate(total=models.Sum('total_price'))['total'] or Decimal('0')
 
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, related_name='cart_items', on_delete=models.CASCADE)
@@ -123,11 +223,43 @@ class CartItem(models.Model):
     total_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
 
     def save(self, *args, **kwargs):
-        self.total_price = self.quantity * self.product.get_discounted_price()
+        self.total_price = self.compute_total_price(self.product, self.quantity)
         super(CartItem, self).save(*args, **kwargs)
 
+    @classmethod
+    def compute_total_price(cls, product, quantity):
+        return line_price(cls._meta.get_field('total_price'), product, quantity)
+
     def get_total_price(self):
         return self.total_price
+
+
+class EmailOutbox(models.Model):
+    """
+    Email waiting to be sent by `manage.py send_outbox_emails`, written in the transaction that needs it sent.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254, blank=True)
+    to = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # the worker's queue: due pending rows, oldest first
+            models.Index(fields=['status', 'next_attempt_at', 'id'], name='outbox_due_idx'),
+        ]
     
 
 
@@ -135,4 +267,22 @@ class CartItem(models.Model):
 
 
 
-    
\ No newline at end of file
+    
+
+class SalesRollup(models.Model):
+    """
+    Units sold and revenue per company, day, product and category, kept in step with order items and
+    cancellations (see ecomapp/rollups.py). Rebuilt from scratch by `manage.py rebuild_sales_rollups`.
+    """
+    company = models.ForeignKey(Company, on_delete=models.CASCADE)
+    day = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    category = models.ForeignKey(Category, on_delete=models.CASCADE)
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            # also the index behind analytics reads: WHERE company = ? AND day BETWEEN ? AND ?
+            models.UniqueConstraint(fields=['company', 'day', 'product', 'category'], name='sales_rollup_key'),
+        ]
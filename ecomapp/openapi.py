@@ -0,0 +1,78 @@
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+from django.conf import settings
+from django.http import HttpResponse
+from django.views.decorators.http import require_safe
+from drf_yasg.app_settings import swagger_settings
+from drf_yasg.codecs import OpenAPICodecJson,yaml_sane_dump
+from .conditional import not_modified,set_validators
+
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPES = {'.json': 'application/json', '.yaml': 'application/yaml'}
+
+
+def build_schema():
+    """
+    Introspect every API view and return the public OpenAPI document as JSON bytes.
+    """
+    generator = swagger_settings.DEFAULT_GENERATOR_CLASS(info=swagger_settings.DEFAULT_INFO)
+    return OpenAPICodecJson(validators=[]).encode(generator.get_schema(request=None, public=True))
+
+
+class PrebuiltSchema:
+    """
+    The OpenAPI document held in memory for the life of the process.
+
+    It is read once from OPENAPI_SCHEMA_PATH, written at deploy by `manage.py build_openapi_schema`;
+    without that file it is generated on first use instead. Each format is encoded once and served
+    with an ETag over its bytes.
+    """
+
+    def __init__(self):
+        self._documents = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        path = getattr(settings, 'OPENAPI_SCHEMA_PATH', None)
+        try:
+            with open(path, 'rb') as schema_file:
+                return schema_file.read()
+        except (TypeError, OSError):
+            logger.warning('No prebuilt OpenAPI schema at %s; generating it in process', path)
+            return build_schema()
+
+    def document(self, format):
+        """
+        `(body, etag)` of the schema in `format` (`.json` or `.yaml`).
+        """
+        with self._lock:
+            if self._documents is None:
+                body = self.load()
+                spec = json.loads(body, object_pairs_hook=OrderedDict)
+                self._documents = {}
+                for name, encoded in (('.json', body), ('.yaml', yaml_sane_dump(spec, binary=True))):
+                    self._documents[name] = (encoded, '"%s"' % hashlib.sha1(encoded).hexdigest())
+            return self._documents[format]
+
+    def clear(self):
+        with self._lock:
+            self._documents = None
+
+
+prebuilt_schema = PrebuiltSchema()
+
+
+@require_safe
+def schema_document(request, format):
+    """
+    Serve the prebuilt OpenAPI schema as JSON or YAML; revalidates with ETag.
+    """
+    if format not in CONTENT_TYPES:
+        return HttpResponse(status=404)
+    body, etag = prebuilt_schema.document(format)
+    return not_modified(request, etag) or set_validators(HttpResponse(body, content_type=CONTENT_TYPES[format]), etag)
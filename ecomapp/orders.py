@@ -0,0 +1,246 @@
+from collections import defaultdict
+from decimal import Decimal
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import serializers
+from .models import Order,OrderItem,OrderCompanyStatus,OrderStatusEvent,Cart,CartItem
+from .inventory import reserve_stock,release_stock,adjust_stock,product_quantities
+from .rollups import item_sales,order_day,company_order_sales,sale_quantities,merge_sales,record_sales
+from .cache import bump_catalog_version
+
+
+def company_totals(items):
+    """
+    Per-company `(subtotal, item_count)` of order items whose product is loaded.
+    """
+    totals = defaultdict(lambda: (Decimal('0'), 0))
+    for item in items:
+        subtotal, item_count = totals[item.product.company_id]
+        totals[item.product.company_id] = (subtotal + item.amount, item_count + 1)
+    totals.pop(None, None)
+    return totals
+
+
+def sync_company_statuses(order, items, statuses=None):
+    """
+    Bring the order's OrderCompanyStatus rows in line with `items`, the order's complete item list:
+    subtotals and item counts are rewritten and companies new to the order get a pending row.
+
+    `statuses` are the order's existing rows; pass an empty list for a freshly created order.
+    """
+    now = timezone.now()
+    totals = company_totals(items)
+    if statuses is None:
+        statuses = list(OrderCompanyStatus.objects.filter(order=order).select_for_update())
+
+    changed = []
+    for order_status in statuses:
+        subtotal, item_count = totals.pop(order_status.company_id, (Decimal('0'), 0))
+        if (order_status.subtotal, order_status.item_count) != (subtotal, item_count):
+            order_status.subtotal, order_status.item_count, order_status.last_updated = subtotal, item_count, now
+            changed.append(order_status)
+
+    if changed:
+        OrderCompanyStatus.objects.bulk_update(changed, ['subtotal', 'item_count', 'last_updated'])
+    if totals:
+        OrderCompanyStatus.objects.bulk_create([
+            OrderCompanyStatus(order=order, company_id=company_id, status='pending', last_updated=now, subtotal=subtotal, item_count=item_count)
+            for company_id, (subtotal, item_count) in sorted(totals.items())
+        ])
+
+
+def place_order(order_data, items_data):
+    """
+    Create an order and all of its items in a fixed number of queries.
+
+    `items_data` are validated order item dicts whose `product` is already a Product instance
+    (fetched in one batch by the list serializer), so pricing happens in memory and the total
+    is written with the initial insert.
+    """
+    items = [
+        OrderItem(product=data['product'], quantity=data['quantity'], amount=OrderItem.compute_amount(data['product'], data['quantity']))
+        for data in items_data
+    ]
+    with transaction.atomic():
+        return create_order(order_data, items)
+
+
+def create_order(order_data, items):
+    """
+    Insert an order with its priced, unsaved `items` (products loaded), the company status rows, the
+    sales rollups and the stock reservation. Run inside a transaction.
+    """
+    order = Order.objects.create(total_price=sum((item.amount for item in items), Decimal('0')), **order_data)
+    for item in items:
+        item.order = order
+    OrderItem.objects.bulk_create(items)
+    sync_company_statuses(order, items, statuses=[])
+    record_sales(item_sales(order_day(order), items))
+    # Last, so the stock rows stay locked for as short a time as possible
+    reserve_stock(product_quantities(items))
+    stock_changed({item.product.company_id for item in items})
+    return order
+
+
+def stock_changed(company_ids):
+    """
+    Catalog responses show stock, so invalidate them for these companies once the transaction commits.
+    """
+    company_ids = [company_id for company_id in company_ids if company_id is not None]
+    transaction.on_commit(lambda: bump_catalog_version(*company_ids))
+
+
+def touch_order(order_id):
+    """
+    Mark every company status row of an order as changed, so conditional reads of the order lists
+    (validated on `last_updated`) see edits to the order itself.
+    """
+    OrderCompanyStatus.objects.filter(order_id=order_id).update(last_updated=timezone.now())
+
+
+def checkout_cart(user, order_data):
+    """
+    Turn the user's cart into an order and empty the cart, in one transaction and a fixed number of queries.
+
+    Order items take the cart lines' stored prices rather than repricing every product. The cart row is
+    locked first so the same cart can't be checked out twice concurrently.
+    """
+    with transaction.atomic():
+        cart = Cart.objects.select_for_update().filter(user=user).first()
+        lines = list(CartItem.objects.filter(cart=cart).select_related('product').order_by('id')) if cart else []
+        if not lines:
+            raise serializers.ValidationError({'cart': 'Your cart is empty.'})
+
+        order = create_order(dict(order_data, user=user), [
+            OrderItem(product=line.product, quantity=line.quantity, amount=line.total_price) for line in lines
+        ])
+        CartItem.objects.filter(cart=cart).delete()
+    return order
+
+
+def update_order_items(order, existing_items, items_data):
+    """
+    Apply an edited item list to an order: items carrying a known `id` are updated, the rest are
+    created, and existing items missing from the list are deleted. One query per kind of change.
+
+    `existing_items` should be loaded with `select_related('product')`. Stock and sales rollups follow
+    the edit, except for lines of companies that canceled their part of the order. Returns the order's items
+    after the edit, in request order.
+    """
+    existing_items = list(existing_items)
+    instance_mapping = {item.id: item for item in existing_items}
+    to_update, to_create, ret = [], [], []
+    statuses = list(OrderCompanyStatus.objects.filter(order=order).select_for_update())
+    canceled = {order_status.company_id for order_status in statuses if order_status.status == 'canceled'}
+    reserved_before = product_quantities(item for item in existing_items if item.product.company_id not in canceled)
+    sold_before = item_sales(order_day(order), (item for item in existing_items if item.product.company_id not in canceled), sign=-1)
+
+    for data in items_data:
+        item = instance_mapping.pop(data.get('id'), None)
+        if item is None:
+            if 'product' not in data or 'quantity' not in data:
+                raise serializers.ValidationError({'order_items': 'New order items need a product and a quantity.'})
+            item = OrderItem(order=order)
+            to_create.append(item)
+        else:
+            to_update.append(item)
+        if 'product' in data:
+            item.product = data['product']
+        if 'quantity' in data:
+            item.quantity = data['quantity']
+        item.amount = OrderItem.compute_amount(item.product, item.quantity)
+        ret.append(item)
+
+    with transaction.atomic():
+        if instance_mapping:
+            OrderItem.objects.filter(id__in=instance_mapping.keys()).delete()
+        if to_update:
+            OrderItem.objects.bulk_update(to_update, ['product', 'quantity', 'amount'])
+        if to_create:
+            OrderItem.objects.bulk_create(to_create)
+        sync_company_statuses(order, ret, statuses)
+        adjust_stock(reserved_before, product_quantities(item for item in ret if item.product.company_id not in canceled))
+        record_sales(merge_sales(sold_before, item_sales(order_day(order), (item for item in ret if item.product.company_id not in canceled))))
+        stock_changed({item.product.company_id for item in existing_items + ret})
+
+    return ret
+
+
+def apply_status_change(order_id, company_id, previous, status):
+    """
+    Side effects of a company's status moving from `previous` to `status` within an order:
+    canceling puts the company's lines back in stock and takes them out of the sales rollups,
+    leaving `canceled` reverses both.
+    Run inside the transaction that writes the status.
+    """
+    apply_status_changes(company_id, {order_id: previous}, status)
+
+
+def apply_status_changes(company_id, previous, status):
+    """
+    `apply_status_change` for many of a company's orders moving to the same `status`; `previous` maps
+    order id to the status it left. Stock and rollups move in one aggregate query and one batched update each.
+    """
+    canceled = [order_id for order_id, old in previous.items() if old != 'canceled' and status == 'canceled']
+    reopened = [order_id for order_id, old in previous.items() if old == 'canceled' and status != 'canceled']
+    if canceled:
+        sales = company_order_sales(canceled, company_id)
+        release_stock(sale_quantities(sales))
+        record_sales(sales, sign=-1)
+    if reopened:
+        sales = company_order_sales(reopened, company_id)
+        reserve_stock(sale_quantities(sales))
+        record_sales(sales)
+    if canceled or reopened:
+        stock_changed([company_id])
+    # Last, so the event ids are taken as close to the commit as possible (see ecomapp/feed.py)
+    record_status_events(company_id, previous, status)
+
+
+def record_status_events(company_id, previous, status):
+    """
+    Append the changes to the status feed log: one query for the orders' customers and one insert.
+    """
+    changed = {order_id: old for order_id, old in previous.items() if old != status}
+    if not changed:
+        return
+    now = timezone.now()
+    customers = dict(Order.objects.filter(id__in=changed).values_list('id', 'user_id'))
+    OrderStatusEvent.objects.bulk_create([
+        OrderStatusEvent(order_id=order_id, company_id=company_id, customer_id=customers[order_id], previous_status=old, status=status, created_at=now)
+        for order_id, old in sorted(changed.items())
+    ])
+
+
+def transition_statuses(company_id, order_ids, status):
+    """
+    Move the company's status on many orders to `status` with a single UPDATE.
+
+    Returns `{order_id: (outcome, current_status)}` where outcome is `updated`, `unchanged` (already there),
+    `not_allowed` (OrderCompanyStatus.TRANSITIONS forbids it) or `not_found`. Stock follows cancellations
+    and reopenings; a reopening that can't be reserved fails the whole call with InsufficientStock.
+    """
+    order_ids = list(dict.fromkeys(order_ids))
+    results = dict.fromkeys(order_ids, ('not_found', None))
+    now = timezone.now()
+
+    with transaction.atomic():
+        current = dict(
+            OrderCompanyStatus.objects.filter(company_id=company_id, order_id__in=order_ids)
+            .order_by('order_id').select_for_update().values_list('order_id', 'status')
+        )
+        moving = {}
+        for order_id, previous in current.items():
+            if previous == status:
+                results[order_id] = ('unchanged', previous)
+            elif status in OrderCompanyStatus.TRANSITIONS[previous]:
+                results[order_id] = ('updated', status)
+                moving[order_id] = previous
+            else:
+                results[order_id] = ('not_allowed', previous)
+
+        if moving:
+            OrderCompanyStatus.objects.filter(company_id=company_id, order_id__in=moving).update(status=status, last_updated=now)
+            apply_status_changes(company_id, moving, status)
+
+    return results
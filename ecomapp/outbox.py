@@ -0,0 +1,85 @@
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMessage,get_connection
+from django.db import transaction
+from django.utils import timezone
+from .models import EmailOutbox
+
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_email(subject, body, from_email, to):
+    """
+    Queue an email for the outbox worker. Call inside the transaction that makes it necessary, so the
+    email exists exactly when that transaction commits.
+    """
+    return EmailOutbox.objects.create(subject=subject, body=body, from_email=from_email or '', to=list(to))
+
+
+def retry_delay(attempts):
+    # Exponential backoff: 1, 2, 4, ... times the base delay, capped
+    base = getattr(settings, 'OUTBOX_RETRY_BACKOFF', 60)
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), getattr(settings, 'OUTBOX_MAX_BACKOFF', 3600)))
+
+
+def send_batch(batch_size=50, max_attempts=None):
+    """
+    Send up to `batch_size` due outbox emails over one connection. Returns `(claimed, sent, given_up)`.
+
+    Rows are locked while they are sent (`SKIP LOCKED`, so several workers can drain the queue).
+    A failed send is retried after a growing delay; after `max_attempts` it is marked failed. Sent
+    rows keep their subject and recipients but drop the body, which may carry credentials.
+    """
+    max_attempts = max_attempts or getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 8)
+    now = timezone.now()
+    sent = failed = 0
+
+    with transaction.atomic():
+        emails = list(
+            EmailOutbox.objects.filter(status='pending', next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')
+            .select_for_update(skip_locked=True)[:batch_size]
+        )
+        if not emails:
+            return 0, 0, 0
+
+        connection = get_connection()
+        try:
+            connection.open()
+        except Exception as exc:
+            # Nothing can be sent this round; count it against every email in the batch
+            logger.warning('Outbox connection failed: %s', exc)
+            for email in emails:
+                failed += not mark_failed(email, exc, now, max_attempts)
+        else:
+            try:
+                for email in emails:
+                    try:
+                        EmailMessage(email.subject, email.body, email.from_email or None, email.to, connection=connection).send()
+                    except Exception as exc:
+                        logger.warning('Outbox email %s failed: %s', email.id, exc)
+                        failed += not mark_failed(email, exc, now, max_attempts)
+                    else:
+                        email.status, email.sent_at, email.body, email.last_error = 'sent', now, '', ''
+                        email.attempts += 1
+                        sent += 1
+            finally:
+                connection.close()
+
+        EmailOutbox.objects.bulk_update(emails, ['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at', 'body'])
+    return len(emails), sent, failed
+
+
+def mark_failed(email, exc, now, max_attempts):
+    """
+    Record a failed attempt; returns True while the email will still be retried.
+    """
+    email.attempts += 1
+    email.last_error = str(exc)[:1000]
+    if email.attempts >= max_attempts:
+        email.status = 'failed'
+        return False
+    email.next_attempt_at = now + retry_delay(email.attempts)
+    return True
@@ -0,0 +1,30 @@
+from rest_framework.pagination import CursorPagination,PageNumberPagination
+
+
+class ProductCursorPagination(CursorPagination):
+    """
+    Keyset pagination for the product catalog.
+
+    Pages are addressed by an opaque `cursor` holding the last seen `id`, so fetching
+    page N is an index range scan (`WHERE id > cursor ORDER BY id LIMIT page_size`)
+    instead of an OFFSET that grows with N. `id` is unique, so the cursor never needs
+    the offset fallback DRF uses for duplicate positions. Filtering by `category` or
+    `company` is served by the `(category, id)` / `(company, id)` indexes on Product.
+
+    With `ordering=price` (see ProductOrderingFilter) the cursor holds the last seen
+    `effective_price` and pages walk the `(effective_price, id)` index; products sharing
+    a price are skipped by offset within that price only.
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    ordering = 'id'
+
+
+class ProductSearchPagination(PageNumberPagination):
+    """
+    Search results are ordered by relevance, which is not unique, so they are paged by number.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
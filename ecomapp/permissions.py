@@ -19,7 +19,7 @@ class IsAdmin(BasePermission):
     def has_object_permission(self, request, view, obj):
         if request.user.is_authenticated:
             # Check if the user is an admin or staff of the company associated with the object
-            if request.user.role in ['admin', 'staff'] and obj.company == request.user.company:
+            if request.user.role in ['admin', 'staff'] and obj.company_id == request.user.company_user_id:
                 return True
         return False
     def has_permission(self, request, view):
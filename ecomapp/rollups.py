@@ -0,0 +1,129 @@
+from collections import defaultdict
+from decimal import Decimal
+from functools import reduce
+from operator import or_
+from django.db.models import Case, DecimalField, Exists, F, IntegerField, OuterRef, Q, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .models import OrderItem,OrderCompanyStatus,SalesRollup
+
+
+BATCH_SIZE = 500
+
+# Rollup key: (company_id, day, product_id, category_id)
+KEY_FIELDS = ('company_id', 'day', 'product_id', 'category_id')
+
+
+def item_sales(day, items, sign=1):
+    """
+    `{key: (quantity, revenue)}` of order items placed on `day`, whose product is loaded; `sign=-1` to take them out.
+    """
+    sales = defaultdict(lambda: (0, Decimal('0')))
+    for item in items:
+        if item.product.company_id is None:
+            continue
+        key = (item.product.company_id, day, item.product_id, item.product.category_id)
+        quantity, revenue = sales[key]
+        sales[key] = (quantity + sign * item.quantity, revenue + sign * item.amount)
+    return sales
+
+
+def order_day(order):
+    return timezone.localdate(order.date_ordered)
+
+
+def company_order_sales(order_ids, company_id):
+    """
+    `{key: (quantity, revenue)}` of one company's lines in the given orders, in one aggregate query.
+    """
+    return {
+        (company_id, row['day'], row['product_id'], row['product__category_id']): (row['quantity'], row['revenue'])
+        for row in OrderItem.objects.filter(order_id__in=order_ids, product__company_id=company_id)
+        .values('product_id', 'product__category_id', day=TruncDate('order__date_ordered'))
+        .annotate(quantity=Sum('quantity'), revenue=Sum('amount'))
+        .order_by()
+    }
+
+
+def sale_quantities(sales):
+    """
+    `{product_id: quantity}` from sales, the shape inventory.py works with.
+    """
+    quantities = defaultdict(int)
+    for (company_id, day, product_id, category_id), (quantity, revenue) in sales.items():
+        quantities[product_id] += quantity
+    return dict(quantities)
+
+
+def merge_sales(*sales_maps):
+    merged = defaultdict(lambda: (0, Decimal('0')))
+    for sales in sales_maps:
+        for key, (quantity, revenue) in sales.items():
+            total_quantity, total_revenue = merged[key]
+            merged[key] = (total_quantity + quantity, total_revenue + revenue)
+    return merged
+
+
+def record_sales(sales, sign=1):
+    """
+    Add `{key: (quantity, revenue)}` to the rollup rows, `sign=-1` to subtract. Run inside the
+    transaction that changes the orders.
+
+    Missing rows are inserted as zeros, ignoring ones another transaction just created, and each batch
+    is then incremented by one UPDATE, so concurrent orders for the same product and day add up
+    instead of overwriting each other.
+    """
+    sales = sorted(
+        (key, (sign * quantity, sign * revenue)) for key, (quantity, revenue) in sales.items()
+        if quantity or revenue
+    )
+    for start in range(0, len(sales), BATCH_SIZE):
+        batch = sales[start:start + BATCH_SIZE]
+        SalesRollup.objects.bulk_create(
+            [SalesRollup(**dict(zip(KEY_FIELDS, key))) for key, delta in batch],
+            ignore_conflicts=True,
+        )
+        matches = [(Q(**dict(zip(KEY_FIELDS, key))), delta) for key, delta in batch]
+        SalesRollup.objects.filter(reduce(or_, (match for match, delta in matches))).update(
+            quantity=Case(
+                *(When(match, then=F('quantity') + quantity) for match, (quantity, revenue) in matches),
+                default=F('quantity'), output_field=IntegerField(),
+            ),
+            revenue=Case(
+                *(When(match, then=F('revenue') + Value(revenue)) for match, (quantity, revenue) in matches),
+                default=F('revenue'), output_field=DecimalField(max_digits=14, decimal_places=2),
+            ),
+        )
+
+
+def rebuild_sales(company_ids=None, product_ids=None):
+    """
+    Recompute rollup rows from order items, leaving out lines of companies that canceled their part of the order;
+    all of them, or those of the given companies or products. Rows take the products' current company and
+    category. Returns the number of rows written. Run inside a transaction.
+    """
+    rollups = SalesRollup.objects.all()
+    items = OrderItem.objects.filter(product__company__isnull=False).exclude(Exists(
+        OrderCompanyStatus.objects.filter(order_id=OuterRef('order_id'), company_id=OuterRef('product__company_id'), status='canceled')
+    ))
+    if company_ids is not None:
+        rollups = rollups.filter(company_id__in=company_ids)
+        items = items.filter(product__company_id__in=company_ids)
+    if product_ids is not None:
+        rollups = rollups.filter(product_id__in=product_ids)
+        items = items.filter(product_id__in=product_ids)
+    rollups.delete()
+
+    rows = (
+        items.values('product_id', company_id=F('product__company_id'), category_id=F('product__category_id'), day=TruncDate('order__date_ordered'))
+        .annotate(quantity=Sum('quantity'), revenue=Sum('amount'))
+        .order_by()
+    )
+    written, batch = 0, []
+    for row in rows.iterator(chunk_size=BATCH_SIZE):
+        batch.append(SalesRollup(**row))
+        if len(batch) == BATCH_SIZE:
+            SalesRollup.objects.bulk_create(batch)
+            written, batch = written + len(batch), []
+    SalesRollup.objects.bulk_create(batch)
+    return written + len(batch)
@@ -0,0 +1,54 @@
+import re
+from django.db import connections
+from django.db.models import BooleanField, FloatField, Q
+from django.db.models.expressions import RawSQL
+
+
+# The search_vector column (PostgreSQL) and the ecomapp_product_fts table (SQLite) are created by
+# migrations (see ecomapp/migrations/_product_search.py); Product_name outranks Description on both
+
+
+def fts5_query(text):
+    # Quote each word so user input can never be parsed as FTS5 syntax; words are ANDed
+    return ' '.join('"%s"' % word for word in re.findall(r'\w+', text))
+
+
+def search_products(queryset, text):
+    """
+    Filter a Product queryset to rows matching `text` and order them by relevance (`rank`, highest first).
+
+    PostgreSQL uses the GIN-indexed `search_vector` column, SQLite the FTS5 table; other backends
+    fall back to an unranked substring match.
+    """
+    vendor = connections[queryset.db].vendor
+
+    if vendor == 'postgresql':
+        from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVectorField
+
+        search_vector = RawSQL('"ecomapp_product"."search_vector"', [], output_field=SearchVectorField())
+        search_query = SearchQuery(text, config='english', search_type='websearch')
+        return (
+            queryset.alias(search=search_vector)
+            .filter(search=search_query)
+            .annotate(rank=SearchRank(search_vector, search_query))
+            .order_by('-rank', 'id')
+        )
+
+    if vendor == 'sqlite':
+        match = fts5_query(text)
+        if not match:
+            return queryset.none()
+        return (
+            queryset.filter(RawSQL(
+                '"ecomapp_product"."id" IN (SELECT rowid FROM ecomapp_product_fts WHERE ecomapp_product_fts MATCH %s)',
+                [match], output_field=BooleanField(),
+            ))
+            .annotate(rank=RawSQL(
+                '(SELECT -bm25(ecomapp_product_fts, 10.0, 1.0) FROM ecomapp_product_fts '
+                'WHERE ecomapp_product_fts MATCH %s AND rowid = "ecomapp_product"."id")',
+                [match], output_field=FloatField(),
+            ))
+            .order_by('-rank', 'id')
+        )
+
+    return queryset.filter(Q(Product_name__icontains=text) | Q(Description__icontains=text)).order_by('id')
@@ -4,6 +4,10 @@ from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
 from django.utils import timezone
 from django.db import transaction
+from decimal import Decimal
+import datetime
+from .orders import place_order,update_order_items,checkout_cart,touch_order
+from .images import schedule_image_processing
 
 class CompanySerializer(serializers.ModelSerializer):
     
@@ -25,6 +29,22 @@ class UserSerializer(serializers.ModelSerializer):
     def validate(self, data):
         if data.get('password') != data.get('Confirm_Password'):
             raise serializers.ValidationError("Passwords do not match")
+
+        # Company access follows company_user, so nobody may join an existing company or pick a company role here
+        role = data.get('role')
+        company_name = (data.get('company') or {}).get('name')
+        if self.instance is None:
+            if role == 'staff':
+                raise serializers.ValidationError({'role': 'Staff accounts are created by invitation.'})
+            if role == 'admin' and not company_name:
+                raise serializers.ValidationError({'company': 'Admins sign up with a new company.'})
+        elif role is not None and role != self.instance.role:
+            raise serializers.ValidationError({'role': 'The role cannot be changed.'})
+        if company_name:
+            if self.instance is not None and self.instance.company_user_id:
+                raise serializers.ValidationError({'company': 'You already belong to a company.'})
+            if Company.objects.filter(name=company_name).exists():
+                raise serializers.ValidationError({'company': 'A company with this name already exists.'})
         return data
 
     def create(self, validated_data):
@@ -47,9 +67,8 @@ class UserSerializer(serializers.ModelSerializer):
         if company_data:
             company_name = company_data.get('name')
             if company_name:
-                # Create or get the company and set the owner_id
-                company, created = Company.objects.get_or_create(name=company_name, defaults={'owner_id': user.id})
-                # Assign the created or existing company to the user
+                # validate() made sure the name is new; the user owns the company they create
+                company = Company.objects.create(name=company_name, owner=user)
                 user.company_user = company
                 user.save()
 
@@ -67,9 +86,8 @@ class UserSerializer(serializers.ModelSerializer):
         if company_data:
             company_name = company_data.get('name')
             if company_name:
-                # Create or get the company and set the owner_id
-                company, created = Company.objects.get_or_create(name=company_name, defaults={'owner_id': user.id})
-                # Assign the created or existing company to the user
+                # validate() made sure the name is new; the user owns the company they create
+                company = Company.objects.create(name=company_name, owner=user)
                 user.company_user = company
                 user.save()
 
@@ -95,7 +113,8 @@ class CategorySerializer(serializers.ModelSerializer):
 class ProductImageSerializer(serializers.ModelSerializer):
     class Meta:
         model = ProductImage
-        fields = ['id', 'image']
+        fields = ['id', 'image', 'thumbnail', 'optimized', 'processing_status']
+        read_only_fields = ['thumbnail', 'optimized', 'processing_status']
 
 class ProductSerializer(serializers.ModelSerializer):
     
@@ -125,10 +144,11 @@ class ProductSerializer(serializers.ModelSerializer):
         
         product = Product.objects.create(category=category, **validated_data)
 
-        # Create ProductImage instances
-        ProductImage.objects.bulk_create([
+        # Create ProductImage instances; thumbnails and compressed variants are generated after the response
+        images = ProductImage.objects.bulk_create([
             ProductImage(product=product, image=image) for image in uploaded_images
         ])
+        schedule_image_processing(image.pk for image in images)
        
 
         return product
@@ -144,37 +164,51 @@ class CustomOrderItemListSerializer(serializers.ListSerializer):
     #         item['order'] = order   #order_id needed instead of self.instance.
     #     return super().validate(attrs)
     
-    
+    def to_internal_value(self, data):
+        # Fetch every referenced product in one query; BulkProductField resolves items from it
+        product_ids = set()
+        if isinstance(data, list):
+            for item in data:
+                try:
+                    product_ids.add(int(item.get('product')))
+                except (AttributeError, TypeError, ValueError):
+                    pass
+        self._products = self.child.fields['product'].get_queryset().in_bulk(product_ids)
+        try:
+            return super().to_internal_value(data)
+        finally:
+            del self._products
 
     def update(self, instance, validated_data):
-        
-        instance_mapping = {item.id: item for item in instance}
-        ret = []
-        
-
-        for data in validated_data:
-            item_id = data.get('id')
-            
-            if item_id and item_id in instance_mapping:
-                # Update existing instance
-                ret.append(self.child.update(instance_mapping.pop(item_id), data))
-            else:
-                # Create new instance
-                data['order'] = instance[0].order
-                ret.append(self.child.create(data))
-
-        if instance_mapping:
-            ids_to_delete = instance_mapping.keys()
-            OrderItem.objects.filter(id__in=ids_to_delete).delete()
-        return ret
+        order = self.root.instance
+        return update_order_items(order, instance, validated_data)
     
 
 
 #-------------------------------------------------------------------------------
 
+class BulkProductField(serializers.PrimaryKeyRelatedField):
+    """
+    Product reference resolved from the batch fetched by CustomOrderItemListSerializer,
+    instead of one `get()` per order item.
+    """
+    def to_internal_value(self, data):
+        products = getattr(self.parent.parent, '_products', None)
+        if products is None:
+            return super().to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            return products[int(data)]
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        except KeyError:
+            self.fail('does_not_exist', pk_value=data)
+
+
 class OrderItemSerializer(serializers.ModelSerializer):
-    # id = serializers.IntegerField(required=False)
-    product = serializers.PrimaryKeyRelatedField(queryset=Product.objects.all())
+    id = serializers.IntegerField(required=False)
+    product = BulkProductField(queryset=Product.objects.all())
 
     class Meta:
         model = OrderItem
@@ -201,62 +235,59 @@ class UserOrderSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         
         order_items_data = validated_data.pop('order_items', []) #order item data same as attrs.
-        
-        order = Order.objects.create(**validated_data) #order created
-              
-        
-        for item in order_items_data:            
-            item['order'] = order  # Link order
-        self.fields['order_items'].create(order_items_data)  
-
-                     
-        
-        # Collect unique companies from the order items
-        companies = {item_data['product'].company for item_data in order_items_data}
-        
-
-        # Bulk create OrderCompanyStatus entries
-        order_company_status_entries = [
-            OrderCompanyStatus(
-                order=order,
-                company=company,
-                status='pending',
-                last_updated=timezone.now()
-            )
-            for company in companies
-        ]
-        
-
-        OrderCompanyStatus.objects.bulk_create(order_company_status_entries)
-
-        # Calculate total price
-        order.calculate_total_price()
 
-        return order
+        # Products were fetched in one batch during validation; items, statuses and the total are written in bulk
+        return place_order(validated_data, order_items_data)
 
 
 
     def update(self, instance, validated_data):
-        order_items_data = validated_data.pop('order_items', [])
-        
-        # Update the Order instance
-        instance = super().update(instance, validated_data)
+        order_items_data = validated_data.pop('order_items', None)
 
-        # Use the custom list serializer to handle bulk updates
-        
-        self.fields['order_items'].update(instance.order_items.all(), order_items_data)
-        
-        # Recalculate total price
-        instance.calculate_total_price()
+        with transaction.atomic():
+            if order_items_data is not None:
+                # Use the custom list serializer to handle bulk updates
+                items = self.fields['order_items'].update(instance.order_items.select_related('product'), order_items_data)
+                validated_data['total_price'] = sum((item.amount for item in items), Decimal('0'))
+
+            # Update the Order instance, total included, in a single save
+            instance = super().update(instance, validated_data)
+            touch_order(instance.id)
         return instance
 
      
 
     
+class CheckoutSerializer(serializers.ModelSerializer):
+    user = serializers.HiddenField(default=serializers.CurrentUserDefault())
+
+    class Meta:
+        model = Order
+        fields = ['user', 'location', 'time_of_delivery']
+
+    def create(self, validated_data):
+        user = validated_data.pop('user')
+        return checkout_cart(user, validated_data)
+
+
 class OrderCompanyStatusSerializer(serializers.ModelSerializer):
     class Meta:
         model = OrderCompanyStatus
-        fields = ['order','company', 'status', 'last_updated']
+        fields = ['order','company', 'status', 'last_updated', 'subtotal', 'item_count']
+        read_only_fields = ['subtotal', 'item_count']
+
+    def validate_status(self, value):
+        current = self.instance.status if self.instance else None
+        if current and value != current and value not in OrderCompanyStatus.TRANSITIONS[current]:
+            raise serializers.ValidationError(f'Cannot change status from "{current}" to "{value}".')
+        return value
+
+
+class OrderStatusBulkTransitionSerializer(serializers.Serializer):
+    MAX_ORDERS = 5000
+
+    order_ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=MAX_ORDERS)
+    status = serializers.ChoiceField(choices=OrderCompanyStatus.STATUS_CHOICES)
 
     
 class AdminOrderItemSerializer(serializers.ModelSerializer):
@@ -268,7 +299,7 @@ class AdminOrderItemSerializer(serializers.ModelSerializer):
 
 
 class AdminOrderSerializer(serializers.ModelSerializer):
-    order_items = AdminOrderItemSerializer(many=True)
+    order_items = serializers.SerializerMethodField()
     filtered_total_price = serializers.SerializerMethodField()
     statuses = OrderCompanyStatusSerializer(source='ordercompanystatus_set', many=True, read_only=True)
 
@@ -281,39 +312,63 @@ class AdminOrderSerializer(serializers.ModelSerializer):
     def get_filtered_total_price(self, instance):
         """
         Calculate the total price based on filtered order items belonging to the admin's company.
+        AdminOrderView reads the subtotal stored on the company's status row; other callers fall back to summing in Python.
         """
-        request = self.context.get('request')
-        user = request.user
+        if hasattr(instance, 'filtered_total_price'):
+            return instance.filtered_total_price
 
-        # Filter the order items to include only those with products from the admin's company
-        filtered_items = [
-            item for item in instance.order_items.all()
-            if item.product.company == user.company
-        ]
-        
-        # Calculate the total price of filtered items
-        total_price = sum(item.amount for item in filtered_items)
+        return sum(item.amount for item in self.get_company_items(instance))
 
-        return total_price
-
-    def to_representation(self, instance):
+    def get_company_items(self, instance):
         """
-        Customize representation to include only order items belonging to the admin's company.
+        Order items whose product belongs to the admin's company, prefetched as `company_items` when available.
         """
-        representation = super().to_representation(instance)
+        if hasattr(instance, 'company_items'):
+            return instance.company_items
+
         request = self.context.get('request')
-        user = request.user
+        return instance.order_items.filter(product__company=request.user.company_user_id)
 
-        # Filter order items to include only those with products belonging to the admin's company
-        filtered_items = [
-            item_data for item_data in representation['order_items']
-            if Product.objects.filter(id=item_data['product'], company=user.company).exists()
-        ]
-        
-        # Update the order_items field in the representation
-        representation['order_items'] = filtered_items
+    def get_order_items(self, instance):
+        """
+        Include only order items belonging to the admin's company.
+        """
+        return AdminOrderItemSerializer(self.get_company_items(instance), many=True).data
+    
+class OrderExportSerializer(serializers.Serializer):
+    output = serializers.ChoiceField(choices=['csv', 'ndjson'], default='csv')
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+
+    def validate(self, data):
+        if data.get('date_from') and data.get('date_to') and data['date_from'] > data['date_to']:
+            raise serializers.ValidationError("date_from must not be after date_to")
+        return data
+
+
+class ProductFacetsSerializer(serializers.Serializer):
+    category = serializers.IntegerField(required=False)
+    company = serializers.IntegerField(required=False)
+    min_price = serializers.FloatField(required=False)
+    max_price = serializers.FloatField(required=False)
+
+
+class SalesAnalyticsSerializer(serializers.Serializer):
+    MAX_DAYS = 366
+
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    group_by = serializers.ChoiceField(choices=['day', 'product', 'category'], default='day')
+
+    def validate(self, data):
+        data.setdefault('date_to', timezone.localdate())
+        data.setdefault('date_from', data['date_to'] - datetime.timedelta(days=29))
+        if data['date_from'] > data['date_to']:
+            raise serializers.ValidationError("date_from must not be after date_to")
+        if (data['date_to'] - data['date_from']).days >= self.MAX_DAYS:
+            raise serializers.ValidationError(f"The range can cover at most {self.MAX_DAYS} days.")
+        return data
 
-        return representation
     
 class CartItemSerializer(serializers.ModelSerializer):
     
@@ -323,6 +378,83 @@ class CartItemSerializer(serializers.ModelSerializer):
         fields = ['id', 'product', 'quantity', 'total_price']
         read_only_fields = ['total_price']
 
+class CartSummaryItemSerializer(serializers.ModelSerializer):
+    product_name = serializers.CharField(source='product.Product_name', read_only=True)
+    unit_price = serializers.FloatField(source='product.get_discounted_price', read_only=True)
+
+    class Meta:
+        model = CartItem
+        fields = ['id', 'product', 'product_name', 'unit_price', 'quantity', 'total_price']
+
+
+class CartSummarySerializer(serializers.Serializer):
+    items = CartSummaryItemSerializer(many=True)
+    item_count = serializers.IntegerField()
+    total_quantity = serializers.IntegerField()
+    total_price = serializers.DecimalField(max_digits=12, decimal_places=2)
+
+
+class CartBulkItemSerializer(serializers.Serializer):
+    product = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=0)
+
+
+class CartBulkSerializer(serializers.Serializer):
+    items = CartBulkItemSerializer(many=True, required=False)
+    remove = serializers.ListField(child=serializers.IntegerField(), required=False)
+
+    def validate(self, data):
+        items, remove = data.get('items', []), data.get('remove', [])
+        if not items and not remove:
+            raise serializers.ValidationError("Provide items to set or products to remove")
+
+        # One product fetch for every line the request touches
+        product_ids = {item['product'] for item in items}
+        products = Product.objects.in_bulk(product_ids)
+        missing = sorted(product_ids - products.keys())
+        if missing:
+            raise serializers.ValidationError({'items': [f'Invalid pk "{pk}" - object does not exist.' for pk in missing]})
+        data['products'] = products
+        return data
+
+    def create(self, validated_data):
+        """
+        Set each listed product's line to the given quantity (0 removes it) and drop the products in `remove`.
+        Lines are repriced from the products fetched during validation and written in bulk.
+        """
+        cart, products = validated_data['cart'], validated_data['products']
+        quantities = {item['product']: item['quantity'] for item in validated_data.get('items', [])}
+        remove = set(validated_data.get('remove', [])) - quantities.keys()
+
+        existing = {}
+        for item in CartItem.objects.filter(cart=cart, product_id__in=quantities.keys() | remove).order_by('id'):
+            existing.setdefault(item.product_id, []).append(item)
+
+        to_update, to_create, to_delete = [], [], []
+        for product_id in remove:
+            to_delete += existing.get(product_id, [])
+        for product_id, quantity in quantities.items():
+            rows = existing.get(product_id, [])
+            if quantity == 0:
+                to_delete += rows
+                continue
+            item = rows[0] if rows else CartItem(cart=cart)
+            to_delete += rows[1:]  # collapse duplicate lines of the same product
+            item.product = products[product_id]
+            item.quantity = quantity
+            item.total_price = CartItem.compute_total_price(item.product, quantity)
+            (to_update if item.pk else to_create).append(item)
+
+        with transaction.atomic():
+            if to_delete:
+                CartItem.objects.filter(id__in=[item.id for item in to_delete]).delete()
+            if to_update:
+                CartItem.objects.bulk_update(to_update, ['quantity', 'total_price'])
+            if to_create:
+                CartItem.objects.bulk_create(to_create)
+        return cart
+
+
 class CartSerializer(serializers.ModelSerializer):
     
     cart_items = CartItemSerializer(many=True, read_only=True)
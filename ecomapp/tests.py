@@ -1,3 +1,1454 @@
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.core.management import call_command
+from io import StringIO
+from django.db.models import F
+import re
+import os
+import time
+import statistics
+import json
+import tempfile
+import shutil
+from io import BytesIO
+from PIL import Image
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from unittest import mock
+from .models import ProductImage,Cart,CartItem,EmailOutbox,OrderStatusEvent,SalesRollup
+from django.core import mail
+from django.core.mail import get_connection
+from django.utils import timezone
+from .images import process_product_image
+from .openapi import prebuilt_schema
+from .views import ProductViewSet
+from rest_framework.test import APITestCase
+from .models import CustomUser,Company,Category,Product,Order,OrderItem,OrderCompanyStatus
+from .cache import catalog_cache,user_cache,bump_catalog_version
+from rest_framework_simplejwt.tokens import AccessToken
+from .authentication import tokens_for_user
+from asgiref.sync import sync_to_async
+from .orders import place_order,transition_statuses
+from .feed import status_feed,event_scope
+import asyncio
+from django.core.cache import cache
+from decimal import Decimal
+import datetime
 
-# Create your tests here.
+
+def make_company(name, email):
+    owner = CustomUser.objects.create_user(email, email=email, password='pass12345', role='admin')
+    company = Company.objects.create(name=name, owner=owner)
+    owner.company_user = company
+    owner.save()
+    return company
+
+
+def make_products(company, category, count, price=10.0):
+    return Product.objects.bulk_create([
+        Product(Product_name=f'Product {i}', Quantity=100, price=price, Description='test product',
+                company=company, category=category, Created_by=company.owner)
+        for i in range(count)
+    ])
+
+
+def make_order(customer, products, quantity=2):
+    # Through the production write path, which keeps company subtotals, stock and rollups in step
+    return place_order(
+        {'user': customer, 'location': 'Kathmandu', 'time_of_delivery': datetime.time(10, 0)},
+        [{'product': product, 'quantity': quantity} for product in products],
+    )
+
+
+class ProductPaginationTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        catalog_cache.clear()
+        self.company = make_company('Acme', 'owner@acme.test')
+        self.other = make_company('Globex', 'owner@globex.test')
+        self.books = Category.objects.create(name='Books')
+        self.toys = Category.objects.create(name='Toys')
+        make_products(self.company, self.books, 7)
+        make_products(self.other, self.toys, 5)
+
+    def collect(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [product['id'] for product in response.data['results']]
+            url = response.data['next']
+        return ids
+
+    def test_cursor_walks_whole_catalog_in_id_order(self):
+        ids = self.collect('/product/?page_size=3')
+        self.assertEqual(ids, list(Product.objects.order_by('id').values_list('id', flat=True)))
+
+    def test_cursor_keeps_filters(self):
+        ids = self.collect(f'/product/?page_size=2&category={self.toys.id}')
+        self.assertEqual(ids, list(Product.objects.filter(category=self.toys).order_by('id').values_list('id', flat=True)))
+
+    def test_page_query_count_does_not_grow_with_depth(self):
+        first = self.client.get('/product/?page_size=2')
+        with self.assertNumQueries(2):
+            self.client.get(first.data['next'])
+
+
+class AdminOrderViewTests(APITestCase):
+
+    def setUp(self):
+        self.company = make_company('Acme', 'owner@acme.test')
+        self.other = make_company('Globex', 'owner@globex.test')
+        category = Category.objects.create(name='Books')
+        self.own = make_products(self.company, category, 3, price=10.0)
+        self.foreign = make_products(self.other, category, 2, price=99.0)
+        self.customer = CustomUser.objects.create_user('buyer@test', email='buyer@test', password='pass12345')
+        self.client.force_authenticate(self.company.owner)
+
+    def test_lists_only_company_items_and_subtotal(self):
+        order = make_order(self.customer, self.own[:2] + self.foreign)
+        make_order(self.customer, self.foreign)
+
+        response = self.client.get('/orders/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['id'] for row in response.data], [order.id])
+        self.assertEqual({item['product'] for item in response.data[0]['order_items']}, {p.id for p in self.own[:2]})
+        self.assertEqual(response.data[0]['filtered_total_price'], Decimal('40.00'))
+
+    def test_summary_totals_revenue_per_status(self):
+        make_order(self.customer, self.own[:2])
+        make_order(self.customer, self.own + self.foreign)
+
+        response = self.client.get('/orders/summary/')
+
+        self.assertEqual(response.data, [{'status': 'pending', 'orders': 2, 'items': 5, 'revenue': Decimal('100.00')}])
+
+    def test_non_numeric_order_is_not_found(self):
+        self.assertEqual(self.client.get('/orders/abc/').status_code, 404)
+
+    def test_query_count_is_constant(self):
+        make_order(self.customer, self.own + self.foreign)
+        with CaptureQueriesContext(connection) as small:
+            self.client.get('/orders/')
+        self.assertEqual(len(small.captured_queries), 4)  # validators, orders, items, statuses
+
+        for _ in range(15):
+            make_order(self.customer, self.own + self.foreign)
+        with self.assertNumQueries(len(small.captured_queries)):
+            response = self.client.get('/orders/')
+        self.assertEqual(len(response.data), 16)
+
+
+class CatalogCacheTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        catalog_cache.clear()
+        self.company = make_company('Acme', 'owner@acme.test')
+        self.product = make_products(self.company, Category.objects.create(name='Books'), 1)[0]
+
+    def test_list_and_detail_are_served_from_cache(self):
+        for url in ['/product/', f'/product/{self.product.id}/']:
+            self.assertEqual(self.client.get(url)['X-Cache'], 'MISS')
+            with self.assertNumQueries(0):
+                self.assertEqual(self.client.get(url)['X-Cache'], 'HIT')
+        self.assertEqual(catalog_cache.stats()['hits'], 2)
+
+    def test_update_bumps_company_version(self):
+        self.client.get('/product/')
+        self.client.get(f'/product/{self.product.id}/')
+
+        self.client.force_authenticate(self.company.owner)
+        response = self.client.patch(f'/product/{self.product.id}/', {'price': 25.0, 'uploaded_images': []}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.client.force_authenticate(None)
+
+        listed = self.client.get('/product/')
+        detail = self.client.get(f'/product/{self.product.id}/')
+        self.assertEqual((listed['X-Cache'], detail['X-Cache']), ('MISS', 'MISS'))
+        self.assertEqual(listed.data['results'][0]['price'], 25.0)
+        self.assertEqual(detail.data['price'], 25.0)
+
+    def test_detail_loaded_during_a_bump_is_not_cached_under_the_new_version(self):
+        load = ProductViewSet.get_object
+
+        def load_then_update(view):
+            product = load(view)
+            # An update commits right after this request read the row
+            bump_catalog_version(self.company.id)
+            return product
+
+        with mock.patch.object(ProductViewSet, 'get_object', load_then_update):
+            self.client.get(f'/product/{self.product.id}/')
+
+        self.assertEqual(self.client.get(f'/product/{self.product.id}/')['X-Cache'], 'MISS')
+
+    def test_non_numeric_detail_is_not_found(self):
+        self.assertEqual(self.client.get('/product/abc/').status_code, 404)
+
+    def test_entries_expire_after_ttl(self):
+        self.client.get('/product/')
+        with mock.patch('ecomapp.cache.time.monotonic', return_value=time.monotonic() + catalog_cache.ttl + 1):
+            self.assertEqual(self.client.get('/product/')['X-Cache'], 'MISS')
+
+
+class OrderPlacementTests(APITestCase):
+
+    def setUp(self):
+        self.company = make_company('Acme', 'owner@acme.test')
+        self.other = make_company('Globex', 'owner@globex.test')
+        category = Category.objects.create(name='Books')
+        self.products = make_products(self.company, category, 20, price=12.5) + make_products(self.other, category, 20, price=3.0)
+        self.customer = CustomUser.objects.create_user('buyer@test', email='buyer@test', password='pass12345')
+        self.client.force_authenticate(self.customer)
+
+    def place(self, products, quantity=2):
+        payload = {
+            'location': 'Kathmandu',
+            'time_of_delivery': '10:00',
+            'order_items': [{'product': product.id, 'quantity': quantity} for product in products],
+        }
+        return self.client.post('/order/', payload, format='json')
+
+    def test_create_prices_items_and_writes_total(self):
+        response = self.place([self.products[0], self.products[25]])
+
+        self.assertEqual(response.status_code, 201)
+        order = Order.objects.get(id=response.data['id'])
+        self.assertEqual(order.total_price, Decimal('31.00'))
+        self.assertEqual(sorted(order.order_items.values_list('amount', flat=True)), [Decimal('6.00'), Decimal('25.00')])
+        self.assertEqual(set(order.ordercompanystatus_set.values_list('company_id', flat=True)), {self.company.id, self.other.id})
+
+    def test_create_query_count_does_not_grow_with_lines(self):
+        with CaptureQueriesContext(connection) as small:
+            self.place(self.products[:2])
+        with self.assertNumQueries(len(small.captured_queries)):
+            self.place(self.products)
+
+    def test_unknown_product_is_rejected(self):
+        response = self.client.post('/order/', {
+            'location': 'Kathmandu', 'time_of_delivery': '10:00', 'order_items': [{'product': 999999, 'quantity': 1}],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_update_edits_adds_and_removes_items(self):
+        order = Order.objects.get(id=self.place(self.products[:2]).data['id'])
+        kept, removed = order.order_items.order_by('id')
+
+        response = self.client.post('/order/', {
+            'id': order.id,
+            'order_items': [{'id': kept.id, 'quantity': 4}, {'product': self.products[30].id, 'quantity': 1}],
+        }, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        order.refresh_from_db()
+        self.assertEqual(order.total_price, Decimal('53.00'))
+        self.assertFalse(OrderItem.objects.filter(id=removed.id).exists())
+        self.assertEqual(OrderItem.objects.get(id=kept.id).quantity, 4)
+        self.assertTrue(order.ordercompanystatus_set.filter(company=self.other).exists())
+
+    def test_company_subtotals_follow_edits(self):
+        order = Order.objects.get(id=self.place([self.products[0], self.products[1], self.products[25]]).data['id'])
+        statuses = {row.company_id: row for row in order.ordercompanystatus_set.all()}
+        self.assertEqual((statuses[self.company.id].subtotal, statuses[self.company.id].item_count), (Decimal('50.00'), 2))
+        self.assertEqual((statuses[self.other.id].subtotal, statuses[self.other.id].item_count), (Decimal('6.00'), 1))
+
+        first = order.order_items.get(product=self.products[0])
+        self.client.post('/order/', {'id': order.id, 'order_items': [{'id': first.id, 'quantity': 1}]}, format='json')
+
+        statuses = {row.company_id: row for row in order.ordercompanystatus_set.all()}
+        self.assertEqual((statuses[self.company.id].subtotal, statuses[self.company.id].item_count), (Decimal('12.50'), 1))
+        self.assertEqual((statuses[self.other.id].subtotal, statuses[self.other.id].item_count), (Decimal('0.00'), 0))
+
+    def test_backfill_command_rebuilds_subtotals(self):
+        order = make_order(self.customer, [self.products[0], self.products[25]])
+        OrderCompanyStatus.objects.filter(order=order, company=self.other).delete()
+        OrderCompanyStatus.objects.update(subtotal=0, item_count=0)
+
+        call_command('backfill_company_subtotals', batch_size=1, stdout=StringIO())
+
+        statuses = {row.company_id: row for row in order.ordercompanystatus_set.all()}
+        self.assertEqual((statuses[self.company.id].subtotal, statuses[self.company.id].item_count), (Decimal('25.00'), 1))
+        self.assertEqual((statuses[self.other.id].subtotal, statuses[self.other.id].item_count), (Decimal('6.00'), 1))
+
+
+class ProductSearchTests(APITestCase):
+
+    def setUp(self):
+        self.company = make_company('Acme', 'owner@acme.test')
+        self.other = make_company('Globex', 'owner@globex.test')
+        category = Category.objects.create(name='Audio')
+        self.headphones, self.cable, self.speaker = make_products(self.company, category, 3)
+        Product.objects.filter(id=self.headphones.id).update(Product_name='Wireless headphones', Description='Over-ear, noise cancelling')
+        Product.objects.filter(id=self.cable.id).update(Product_name='Charging cable', Description='Charges wireless headphones docks')
+        self.foreign = make_products(self.other, category, 1)[0]
+        Product.objects.filter(id=self.foreign.id).update(Product_name='Wireless headphones', Description='Budget model')
+
+    def test_ranks_name_matches_first(self):
+        response = self.client.get('/product/search/?q=wireless headphones')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual(response.data['results'][-1]['id'], self.cable.id)
+
+    def test_applies_list_filters(self):
+        response = self.client.get(f'/product/search/?q=headphones&company={self.other.id}')
+        self.assertEqual([row['id'] for row in response.data['results']], [self.foreign.id])
+
+    def test_follows_deletes_and_rejects_empty_query(self):
+        Product.objects.filter(id=self.headphones.id).delete()
+        self.assertEqual(self.client.get('/product/search/?q=noise').data['count'], 0)
+        self.assertEqual(self.client.get('/product/search/?q=').status_code, 400)
+
+
+class QueryPlanTests(TestCase):
+    """
+    EXPLAIN the hot lookups against a seeded dataset and fail on any sequential scan.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        companies = [make_company(f'Company {i}', f'owner{i}@plan.test') for i in range(20)]
+        categories = [Category.objects.create(name=f'Category {i}') for i in range(10)]
+        cls.company, cls.category = companies[3], categories[4]
+        for company in companies:
+            for category in categories:
+                make_products(company, category, 10)
+
+        customers = CustomUser.objects.bulk_create([
+            CustomUser(email=f'customer{i}@plan.test', username=f'customer{i}') for i in range(50)
+        ])
+        cls.customer = customers[7]
+        orders = Order.objects.bulk_create([
+            Order(user=customers[i % 50], location='Kathmandu', time_of_delivery=datetime.time(10, 0)) for i in range(2000)
+        ])
+        OrderCompanyStatus.objects.bulk_create([
+            OrderCompanyStatus(order=order, company=companies[i % 20], status=['pending', 'shipped', 'delivered', 'canceled'][i % 4], item_count=1)
+            for i, order in enumerate(orders)
+        ])
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+    def assertNoSequentialScan(self, queryset):
+        plan = queryset.explain()
+        if connection.vendor == 'postgresql':
+            self.assertNotIn('Seq Scan', plan, plan)
+        else:
+            # SQLite reports a full table scan as "SCAN <table>" without an index
+            self.assertIsNone(re.search(r'\bSCAN \w+$', plan, re.MULTILINE), plan)
+
+    def test_products_by_company_and_category(self):
+        self.assertNoSequentialScan(Product.objects.filter(company=self.company, category=self.category).order_by('id'))
+
+    def test_customer_orders_by_date(self):
+        self.assertNoSequentialScan(Order.objects.filter(user=self.customer).order_by('-date_ordered'))
+
+    def test_company_statuses_by_status_and_last_update(self):
+        self.assertNoSequentialScan(
+            OrderCompanyStatus.objects.filter(company=self.company, status='pending').order_by('-last_updated').values('order_id')
+        )
+
+    def test_admin_order_list(self):
+        self.assertNoSequentialScan(
+            Order.objects.filter(ordercompanystatus__company=self.company, ordercompanystatus__item_count__gt=0)
+            .annotate(filtered_total_price=F('ordercompanystatus__subtotal'))
+            .order_by('-date_ordered', '-id')
+        )
+
+    def test_login_lookup_by_email(self):
+        self.assertNoSequentialScan(CustomUser.objects.filter(email='customer7@plan.test'))
+
+
+class ProductImagePipelineTests(APITestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.company = make_company('Acme', 'owner@acme.test')
+        self.category = Category.objects.create(name='Books')
+        self.client.force_authenticate(self.company.owner)
+
+    def upload(self, size=(2400, 1200)):
+        buffer = BytesIO()
+        Image.new('RGB', size, (200, 30, 30)).save(buffer, 'PNG')
+        return SimpleUploadedFile('shot.png', buffer.getvalue(), content_type='image/png')
+
+    def test_create_stores_original_and_defers_processing(self):
+        with mock.patch('ecomapp.images.get_executor') as get_executor, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/product/', {
+                'category_id': self.category.id, 'Product_name': 'Book', 'Quantity': 3, 'price': 10,
+                'Description': 'A book', 'uploaded_images': [self.upload()],
+            }, format='multipart')
+
+        self.assertEqual(response.status_code, 201)
+        image = ProductImage.objects.get(product_id=response.data['id'])
+        self.assertEqual(image.processing_status, 'pending')
+        get_executor.return_value.submit.assert_called_once_with(mock.ANY, image.id)
+
+    def test_processing_writes_variants(self):
+        product = make_products(self.company, self.category, 1)[0]
+        image = ProductImage(product=product)
+        image.image.save('shot.png', self.upload(), save=True)
+
+        process_product_image(image.id)
+
+        image.refresh_from_db()
+        self.assertEqual(image.processing_status, 'done')
+        with Image.open(image.thumbnail.path) as thumbnail:
+            self.assertEqual(thumbnail.size, (320, 320))
+        with Image.open(image.optimized.path) as optimized:
+            self.assertEqual(optimized.size, (1600, 800))
+        data = self.client.get(f'/product/{product.id}/').data['images'][0]
+        self.assertTrue(data['thumbnail'].endswith(image.thumbnail.url))
+
+
+class OrderExportTests(APITestCase):
+
+    def setUp(self):
+        self.company = make_company('Acme', 'owner@acme.test')
+        other = make_company('Globex', 'owner@globex.test')
+        category = Category.objects.create(name='Books')
+        self.own = make_products(self.company, category, 2)
+        foreign = make_products(other, category, 1)
+        customer = CustomUser.objects.create_user('buyer@test', email='buyer@test', password='pass12345')
+        self.old = make_order(customer, self.own + foreign)
+        Order.objects.filter(id=self.old.id).update(date_ordered=datetime.datetime(2024, 1, 15, 12, 0, tzinfo=datetime.timezone.utc))
+        self.recent = make_order(customer, self.own[:1])
+        self.client.force_authenticate(self.company.owner)
+
+    def test_csv_streams_company_lines(self):
+        response = self.client.get('/orders/export/')
+
+        self.assertTrue(response.streaming)
+        rows = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(rows[0].split(',')[:2], ['order_id', 'date_ordered'])
+        self.assertEqual([row.split(',')[0] for row in rows[1:]], [str(self.old.id)] * 2 + [str(self.recent.id)])
+
+    def test_ndjson_with_date_range(self):
+        response = self.client.get('/orders/export/?output=ndjson&date_from=2024-01-15&date_to=2024-01-15')
+
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual({line['order_id'] for line in lines}, {self.old.id})
+        self.assertEqual({line['product_id'] for line in lines}, {product.id for product in self.own})
+        self.assertEqual(lines[0]['status'], 'pending')
+
+    def test_rejects_inverted_range(self):
+        response = self.client.get('/orders/export/?date_from=2024-02-01&date_to=2024-01-01')
+        self.assertEqual(response.status_code, 400)
+
+
+class EndpointBenchmarkTests(TestCase):
+    """
+    Drive the hot endpoints through the test client against a synthetic dataset, record latency
+    percentiles and SQL query counts, and fail when an endpoint exceeds its query budget.
+
+    Dataset size and iterations come from BENCH_PRODUCTS, BENCH_ORDERS and BENCH_ITERATIONS;
+    the JSON report is written to the path in BENCH_REPORT, and not at all when it is unset.
+    """
+    QUERY_BUDGETS = {
+        'product-list': 2,
+        'product-detail': 3,  # company lookup first, so the version is read before the row
+        'order-create': 12,  # includes the stock reservation (lock + conditional UPDATE in a savepoint) and the sales rollup upsert
+        'admin-order-list': 4,
+        'cart-list': 2,
+        'cart-add': 3,
+        'login': 1,
+    }
+    results = {}
+
+    @classmethod
+    def setUpTestData(cls):
+        products = int(os.environ.get('BENCH_PRODUCTS', 200))
+        orders = int(os.environ.get('BENCH_ORDERS', 50))
+        cls.iterations = int(os.environ.get('BENCH_ITERATIONS', 20))
+
+        cls.company = make_company('Bench', 'owner@bench.test')
+        category = Category.objects.create(name='Bench')
+        cls.products = make_products(cls.company, category, products)
+        cls.customer = CustomUser.objects.create_user('customer@bench.test', email='customer@bench.test', password='pass12345')
+        for i in range(orders):
+            make_order(cls.customer, cls.products[i % products:i % products + 5])
+        cart = Cart.objects.create(user=cls.customer)
+        for product in cls.products[:10]:
+            CartItem.objects.create(cart=cart, product=product, quantity=1)
+
+    @classmethod
+    def tearDownClass(cls):
+        path = os.environ.get('BENCH_REPORT')
+        if path:
+            with open(path, 'w') as report:
+                json.dump({
+                    'dataset': {'products': len(cls.products), 'iterations': cls.iterations},
+                    'endpoints': cls.results,
+                }, report, indent=2, sort_keys=True)
+        super().tearDownClass()
+
+    def token_for(self, email):
+        response = self.client.post('/login/', {'email': email, 'password': 'pass12345'}, content_type='application/json')
+        return f"Bearer {response.json()['access_token']}"
+
+    def bench(self, name, request, before=None):
+        timings, queries = [], []
+        for _ in range(self.iterations):
+            if before:
+                before()
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                response = request()
+                timings.append((time.perf_counter() - start) * 1000)
+            self.assertLess(response.status_code, 400, getattr(response, 'content', b'')[:500])
+            queries.append(len(captured.captured_queries))
+
+        percentiles = statistics.quantiles(timings, n=100, method='inclusive')
+        self.results[name] = {
+            'p50_ms': round(percentiles[49], 3),
+            'p95_ms': round(percentiles[94], 3),
+            'p99_ms': round(percentiles[98], 3),
+            'max_queries': max(queries),
+            'query_budget': self.QUERY_BUDGETS[name],
+        }
+        self.assertLessEqual(max(queries), self.QUERY_BUDGETS[name], f'{name} exceeded its query budget')
+
+    def test_product_list(self):
+        self.bench('product-list', lambda: self.client.get('/product/'), before=catalog_cache.clear)
+
+    def test_product_detail(self):
+        self.bench('product-detail', lambda: self.client.get(f'/product/{self.products[0].id}/'), before=catalog_cache.clear)
+
+    def test_order_create(self):
+        auth = self.token_for('customer@bench.test')
+        payload = {
+            'location': 'Kathmandu', 'time_of_delivery': '10:00',
+            'order_items': [{'product': product.id, 'quantity': 1} for product in self.products[:20]],
+        }
+        self.bench('order-create', lambda: self.client.post('/order/', payload, content_type='application/json', HTTP_AUTHORIZATION=auth))
+
+    def test_admin_order_list(self):
+        auth = self.token_for('owner@bench.test')
+        self.bench('admin-order-list', lambda: self.client.get('/orders/', HTTP_AUTHORIZATION=auth))
+
+    def test_cart_list(self):
+        auth = self.token_for('customer@bench.test')
+        self.bench('cart-list', lambda: self.client.get('/cart/', HTTP_AUTHORIZATION=auth))
+
+    def test_cart_add(self):
+        auth = self.token_for('customer@bench.test')
+        payload = {'product': self.products[50 % len(self.products)].id, 'quantity': 1}
+        self.bench('cart-add', lambda: self.client.post('/cart/', payload, content_type='application/json', HTTP_AUTHORIZATION=auth))
+
+    def test_login(self):
+        payload = {'email': 'customer@bench.test', 'password': 'pass12345'}
+        self.bench('login', lambda: self.client.post('/login/', payload, content_type='application/json'))
+
+
+class InventoryReservationTests(APITestCase):
+
+    def setUp(self):
+        self.company = make_company('Acme', 'owner@acme.test')
+        category = Category.objects.create(name='Books')
+        self.book, self.pen = make_products(self.company, category, 2)
+        Product.objects.filter(id=self.book.id).update(Quantity=5)
+        Product.objects.filter(id=self.pen.id).update(Quantity=1)
+        self.customer = CustomUser.objects.create_user('buyer@test', email='buyer@test', password='pass12345')
+        self.client.force_authenticate(self.customer)
+
+    def stock(self):
+        return dict(Product.objects.values_list('id', 'Quantity'))
+
+    def place(self, lines):
+        return self.client.post('/order/', {
+            'location': 'Kathmandu', 'time_of_delivery': '10:00',
+            'order_items': [{'product': product.id, 'quantity': quantity} for product, quantity in lines],
+        }, format='json')
+
+    def test_order_takes_stock(self):
+        self.assertEqual(self.place([(self.book, 3), (self.pen, 1)]).status_code, 201)
+        self.assertEqual(self.stock(), {self.book.id: 2, self.pen.id: 0})
+
+    def test_short_line_rejects_whole_order(self):
+        response = self.place([(self.book, 3), (self.pen, 2)])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['order_items'], [f'Only 1 left of product {self.pen.id}.'])
+        self.assertEqual(self.stock(), {self.book.id: 5, self.pen.id: 1})
+        self.assertFalse(Order.objects.exists())
+
+    def test_edit_adjusts_stock(self):
+        order_id = self.place([(self.book, 3)]).data['id']
+        item = OrderItem.objects.get(order_id=order_id)
+
+        self.client.post('/order/', {'id': order_id, 'order_items': [{'id': item.id, 'quantity': 1}, {'product': self.pen.id, 'quantity': 1}]}, format='json')
+
+        self.assertEqual(self.stock(), {self.book.id: 4, self.pen.id: 0})
+
+    def test_cancel_releases_and_reopen_reserves(self):
+        order_id = self.place([(self.book, 3)]).data['id']
+        self.client.force_authenticate(self.company.owner)
+        url = f'/update-status/{order_id}/{self.company.id}/'
+
+        self.assertEqual(self.client.put(url, {'status': 'canceled'}, format='json').status_code, 200)
+        self.assertEqual(self.stock()[self.book.id], 5)
+
+        self.client.put(url, {'status': 'pending'}, format='json')
+        self.assertEqual(self.stock()[self.book.id], 2)
+
+
+class CartSummaryTests(APITestCase):
+
+    def setUp(self):
+        company = make_company('Acme', 'owner@acme.test')
+        category = Category.objects.create(name='Books')
+        self.book, self.pen, self.mug = make_products(company, category, 3, price=12.5)
+        self.customer = CustomUser.objects.create_user('buyer@test', email='buyer@test', password='pass12345')
+        self.client.force_authenticate(self.customer)
+
+    def bulk(self, payload):
+        return self.client.post('/cart/bulk/', payload, format='json')
+
+    def test_empty_cart_summary(self):
+        response = self.client.get('/cart/summary/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['items'], [])
+        self.assertEqual((response.data['item_count'], response.data['total_quantity'], response.data['total_price']), (0, 0, '0.00'))
+
+    def test_summary_totals_in_one_query(self):
+        self.bulk({'items': [{'product': self.book.id, 'quantity': 2}, {'product': self.pen.id, 'quantity': 3}]})
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/cart/summary/')
+
+        self.assertEqual(response.data['item_count'], 2)
+        self.assertEqual(response.data['total_quantity'], 5)
+        self.assertEqual(response.data['total_price'], '62.50')
+        self.assertEqual([item['product_name'] for item in response.data['items']], ['Product 0', 'Product 1'])
+
+    def test_bulk_sets_removes_and_collapses_lines(self):
+        cart = Cart.objects.create(user=self.customer)
+        CartItem.objects.create(cart=cart, product=self.book, quantity=1)
+        CartItem.objects.create(cart=cart, product=self.book, quantity=4)
+        CartItem.objects.create(cart=cart, product=self.pen, quantity=1)
+
+        response = self.bulk({
+            'items': [{'product': self.book.id, 'quantity': 3}, {'product': self.mug.id, 'quantity': 1}],
+            'remove': [self.pen.id],
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            sorted(CartItem.objects.filter(cart=cart).values_list('product_id', 'quantity', 'total_price')),
+            [(self.book.id, 3, Decimal('37.50')), (self.mug.id, 1, Decimal('12.50'))],
+        )
+        self.assertEqual(response.data['total_price'], '50.00')
+
+        self.bulk({'items': [{'product': self.mug.id, 'quantity': 0}]})
+        self.assertEqual(cart.get_total_price(), Decimal('37.50'))
+
+    def test_bulk_rejects_unknown_products(self):
+        response = self.bulk({'items': [{'product': self.book.id, 'quantity': 1}, {'product': 9999, 'quantity': 1}]})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(CartItem.objects.exists())
+
+
+class CartCheckoutTests(APITestCase):
+
+    def setUp(self):
+        self.acme = make_company('Acme', 'owner@acme.test')
+        self.globex = make_company('Globex', 'owner@globex.test')
+        category = Category.objects.create(name='Books')
+        self.acme_products = make_products(self.acme, category, 10)
+        self.globex_products = make_products(self.globex, category, 10, price=20.0)
+        self.customer = CustomUser.objects.create_user('buyer@test', email='buyer@test', password='pass12345')
+        self.client.force_authenticate(self.customer)
+
+    def fill_cart(self, products, quantity=2):
+        self.client.post('/cart/bulk/', {'items': [{'product': product.id, 'quantity': quantity} for product in products]}, format='json')
+
+    def checkout(self):
+        return self.client.post('/cart/checkout/', {'location': 'Kathmandu', 'time_of_delivery': '10:00'}, format='json')
+
+    def test_checkout_creates_order_and_empties_cart(self):
+        self.fill_cart(self.acme_products[:2] + self.globex_products[:1])
+
+        response = self.checkout()
+
+        self.assertEqual(response.status_code, 201)
+        order = Order.objects.get(id=response.data['id'])
+        self.assertEqual(order.total_price, Decimal('80.00'))
+        self.assertEqual(order.order_items.count(), 3)
+        self.assertEqual(
+            sorted(OrderCompanyStatus.objects.filter(order=order).values_list('company_id', 'subtotal', 'item_count')),
+            [(self.acme.id, Decimal('40.00'), 2), (self.globex.id, Decimal('40.00'), 1)],
+        )
+        self.assertEqual(Product.objects.get(id=self.acme_products[0].id).Quantity, 98)
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_query_count_does_not_grow_with_cart(self):
+        counts = []
+        # Both carts hold several products: single-product reservations skip the row lock on backends that have one
+        for products in (self.acme_products[:2], self.acme_products + self.globex_products):
+            self.fill_cart(products)
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.checkout().status_code, 201)
+            counts.append(len(queries))
+
+        self.assertEqual(counts[0], counts[1])
+
+    def test_empty_cart_and_short_stock_are_rejected(self):
+        self.assertEqual(self.checkout().status_code, 400)
+
+        self.fill_cart(self.acme_products[:1], quantity=500)
+        response = self.checkout()
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(CartItem.objects.count(), 1)
+
+
+class ClaimsAuthenticationTests(APITestCase):
+
+    def setUp(self):
+        user_cache.clear()
+        self.company = make_company('Acme', 'owner@acme.test')
+        category = Category.objects.create(name='Books')
+        make_products(self.company, category, 3)
+        self.customer = CustomUser.objects.create_user('buyer@test', email='buyer@test', password='pass12345', first_name='Ram')
+
+    def login(self, email):
+        response = self.client.post('/login/', {'email': email, 'password': 'pass12345'}, format='json')
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access_token']}")
+
+    def test_token_carries_claims(self):
+        response = self.client.post('/token/', {'email': 'owner@acme.test', 'password': 'pass12345'}, format='json')
+        token = AccessToken(response.data['access'])
+
+        self.assertEqual((token['role'], token['company_user_id']), ('admin', self.company.id))
+
+    def test_authenticated_reads_skip_user_lookup(self):
+        self.login('buyer@test')
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/cart/summary/').status_code, 200)
+
+        self.login('owner@acme.test')
+        with self.assertNumQueries(2):
+            response = self.client.get('/product/')
+        self.assertEqual(len(response.data['results']), 3)
+
+    def test_other_fields_load_once_from_user_cache(self):
+        self.login('buyer@test')
+        request = self.client.get('/cart/summary/').wsgi_request
+
+        with self.assertNumQueries(1):
+            self.assertEqual(request.user.first_name, 'Ram')
+            self.assertEqual(request.user.last_name, '')
+
+    def test_tokens_without_claims_use_user_cache(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.customer)}')
+
+        with self.assertNumQueries(2):
+            self.client.get('/cart/summary/')
+        with self.assertNumQueries(1):
+            self.client.get('/cart/summary/')
+
+    def test_refresh_reloads_the_user(self):
+        refresh = str(tokens_for_user(self.customer))
+        CustomUser.objects.filter(id=self.customer.id).update(role='staff')
+
+        access = AccessToken(self.client.post('/token/refresh/', {'refresh': refresh}, format='json').data['access'])
+        self.assertEqual(access['role'], 'staff')
+
+        CustomUser.objects.filter(id=self.customer.id).update(is_active=False)
+        self.assertEqual(self.client.post('/token/refresh/', {'refresh': refresh}, format='json').status_code, 401)
+
+    def test_invited_user_cannot_log_in_before_accepting(self):
+        CustomUser.objects.create_user('invitee@test', email='invitee@test', password='pass12345', is_active=False)
+
+        response = self.client.post('/login/', {'email': 'invitee@test', 'password': 'pass12345'}, format='json')
+
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.data, {'message': 'Invalid email or password'})
+
+    def test_inactive_claim_is_rejected(self):
+        self.customer.is_active = False
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {tokens_for_user(self.customer).access_token}')
+
+        self.assertEqual(self.client.get('/cart/summary/').status_code, 401)
+
+    def test_profile_update_invalidates_user_cache(self):
+        self.login('buyer@test')
+        self.assertEqual(self.client.get('/cart/summary/').wsgi_request.user.first_name, 'Ram')
+
+        response = self.client.patch(f'/user/{self.customer.id}/', {'first_name': 'Shyam'}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get('/cart/summary/').wsgi_request.user.first_name, 'Shyam')
+
+
+@override_settings(LOGIN_THROTTLE_RATES={'ip': (6, 60), 'email': (3, 60)})
+class LoginThrottleTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        CustomUser.objects.create_user('buyer@test', email='buyer@test', password='pass12345')
+
+    def login(self, email, password='wrong', ip='10.0.0.1'):
+        return self.client.post('/login/', {'email': email, 'password': password}, format='json', REMOTE_ADDR=ip)
+
+    def test_unknown_and_wrong_password_look_the_same(self):
+        unknown, wrong = self.login('nobody@test'), self.login('buyer@test')
+
+        self.assertEqual((unknown.status_code, unknown.data), (wrong.status_code, wrong.data))
+        self.assertEqual(wrong.status_code, 401)
+
+    def test_email_limit_rejects_before_hashing(self):
+        for _ in range(3):
+            self.login('buyer@test')
+
+        with mock.patch.object(CustomUser, 'check_password') as check_password, mock.patch.object(CustomUser, 'set_password') as set_password:
+            response = self.login('buyer@test', password='pass12345', ip='10.0.0.2')
+
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+        check_password.assert_not_called()
+        set_password.assert_not_called()
+
+    def test_ip_limit_spans_emails_and_successes_are_not_counted(self):
+        for _ in range(3):
+            self.assertEqual(self.login('buyer@test', password='pass12345').status_code, 200)
+        for i in range(6):
+            self.login(f'user{i}@test')
+
+        self.assertEqual(self.login('buyer@test', password='pass12345').status_code, 429)
+        self.assertEqual(self.login('buyer@test', password='pass12345', ip='10.0.0.9').status_code, 200)
+
+    def test_throttle_decisions_are_exposed_as_metrics(self):
+        for _ in range(4):
+            self.login('buyer@test')
+        self.login('buyer@test', password='pass12345', ip='10.0.0.2')
+
+        self.client.force_authenticate(make_company('Acme', 'owner@acme.test').owner)
+        metrics = self.client.get('/metrics/').data['login_throttle']
+
+        self.assertEqual(metrics, {'allowed': 0, 'failed': 3, 'throttled_ip': 0, 'throttled_email': 2})
+
+
+@override_settings(TOKEN_BUCKET_RATES={'anon': '2/min', 'customer': '3/min', 'staff': '5/min', 'admin': '5/min', 'company': '4/min'})
+class TokenBucketThrottleTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.company = make_company('Acme', 'owner@acme.test')
+        self.staff = CustomUser.objects.create_user('staff@acme.test', email='staff@acme.test', password='pass12345', role='staff', company_user=self.company)
+        self.customer = CustomUser.objects.create_user('buyer@test', email='buyer@test', password='pass12345')
+
+    def statuses(self, count, **extra):
+        return [self.client.get('/product/', **extra).status_code for _ in range(count)]
+
+    def test_anonymous_budget_is_per_ip(self):
+        self.assertEqual(self.statuses(3), [200, 200, 429])
+        self.assertEqual(self.statuses(1, REMOTE_ADDR='10.0.0.2'), [200])
+
+    def test_rejection_sends_retry_after(self):
+        self.statuses(2)
+        response = self.client.get('/product/')
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '30')
+
+    def test_budget_follows_role(self):
+        self.client.force_authenticate(self.customer)
+        self.assertEqual(self.statuses(4), [200, 200, 200, 429])
+
+    def test_company_budget_is_shared_by_its_users(self):
+        self.client.force_authenticate(self.staff)
+        self.assertEqual(self.statuses(3), [200, 200, 200])
+
+        self.client.force_authenticate(self.company.owner)
+        self.assertEqual(self.statuses(2), [200, 429])
+
+    def test_bucket_refills_over_time(self):
+        self.client.force_authenticate(self.customer)
+        with mock.patch('ecomapp.throttling.time.time', return_value=1000.0):
+            self.assertEqual(self.statuses(4), [200, 200, 200, 429])
+        with mock.patch('ecomapp.throttling.time.time', return_value=1020.0):
+            self.assertEqual(self.statuses(2), [200, 429])
+
+
+class ConditionalGetTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        catalog_cache.clear()
+        self.company = make_company('Acme', 'owner@acme.test')
+        category = Category.objects.create(name='Books')
+        self.products = make_products(self.company, category, 3)
+        self.customer = CustomUser.objects.create_user('buyer@test', email='buyer@test', password='pass12345')
+
+    def revalidate(self, url, response):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_unchanged_product_list_is_not_modified(self):
+        first = self.client.get('/product/')
+
+        with CaptureQueriesContext(connection) as queries:
+            second = self.revalidate('/product/', first)
+
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertEqual(len(queries), 0)
+
+    def test_product_change_moves_the_validators(self):
+        url = f'/product/{self.products[0].id}/'
+        first = self.client.get(url)
+        self.assertIn('Last-Modified', first)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.revalidate(url, first).status_code, 304)
+        self.assertEqual(len(queries), 1)
+
+        self.client.force_authenticate(self.company.owner)
+        self.client.patch(url, {'price': 12.0}, format='multipart')
+        self.client.force_authenticate(None)
+
+        self.assertEqual(self.revalidate(url, first).status_code, 200)
+
+    def test_placing_an_order_invalidates_stock_in_the_catalog(self):
+        first = self.client.get('/product/')
+        self.client.force_authenticate(self.customer)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/order/', {'location': 'Kathmandu', 'time_of_delivery': '10:00',
+                                         'order_items': [{'product': self.products[0].id, 'quantity': 1}]}, format='json')
+        self.client.force_authenticate(None)
+
+        response = self.revalidate('/product/', first)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['Quantity'], 99)
+
+    def test_order_list_revalidates_on_status_rows(self):
+        order = make_order(self.customer, self.products[:2])
+        self.client.force_authenticate(self.company.owner)
+        first = self.client.get('/orders/')
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.revalidate('/orders/', first).status_code, 304)
+
+        self.client.put(f'/update-status/{order.id}/{self.company.id}/', {'status': 'shipped'}, format='json')
+        self.assertEqual(self.revalidate('/orders/', first).status_code, 200)
+
+    def test_order_edit_changes_the_order_etag(self):
+        order = make_order(self.customer, self.products[:1])
+        self.client.force_authenticate(self.company.owner)
+        first = self.client.get(f'/orders/{order.id}/')
+
+        self.client.force_authenticate(self.customer)
+        self.client.post('/order/', {'id': order.id, 'location': 'Pokhara'}, format='json')
+        self.client.force_authenticate(self.company.owner)
+
+        self.assertEqual(self.revalidate(f'/orders/{order.id}/', first).status_code, 200)
+
+
+class OpenAPISchemaTests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'openapi.json')
+        prebuilt_schema.clear()
+        self.addCleanup(prebuilt_schema.clear)
+
+    def test_command_output_is_served_with_etag(self):
+        call_command('build_openapi_schema', output=self.path, stdout=StringIO())
+
+        with override_settings(OPENAPI_SCHEMA_PATH=self.path), mock.patch('ecomapp.openapi.build_schema') as build_schema:
+            response = self.client.get('/swagger.json/')
+            cached = self.client.get('/swagger.json/', HTTP_IF_NONE_MATCH=response['ETag'])
+            yaml = self.client.get('/swagger.yaml/')
+
+        build_schema.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('/cart/checkout/', json.loads(response.content)['paths'])
+        self.assertEqual(cached.status_code, 304)
+        self.assertTrue(yaml.content.startswith(b'swagger:'))
+
+    def test_schema_is_generated_once_without_a_prebuilt_file(self):
+        with override_settings(OPENAPI_SCHEMA_PATH=self.path), mock.patch('ecomapp.openapi.build_schema', return_value=b'{"swagger": "2.0"}') as build_schema:
+            for _ in range(3):
+                self.assertEqual(self.client.get('/swagger.json/').status_code, 200)
+
+        build_schema.assert_called_once()
+
+    def test_ui_points_at_the_prebuilt_schema(self):
+        response = self.client.get('/swagger/')
+
+        self.assertContains(response, '/swagger.json/')
+
+
+class AsyncReadTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        catalog_cache.clear()
+        self.company = make_company('Acme', 'owner@acme.test')
+        category = Category.objects.create(name='Books')
+        self.products = make_products(self.company, category, 5)
+        self.customer = CustomUser.objects.create_user('buyer@test', email='buyer@test', password='pass12345')
+        self.order = make_order(self.customer, self.products[:2])
+        self.auth = {'Authorization': f'Bearer {tokens_for_user(self.customer).access_token}'}
+
+    async def test_product_pages_match_sync_payload(self):
+        first = await self.async_client.get('/async/product/', {'page_size': 3})
+        second = await self.async_client.get(first.json()['next'])
+        sync = await sync_to_async(self.client.get)('/product/')
+
+        self.assertEqual(first.json()['results'] + second.json()['results'], json.loads(json.dumps(sync.data['results'])))
+        self.assertIsNone(second.json()['next'])
+
+    async def test_product_detail(self):
+        response = await self.async_client.get(f'/async/product/{self.products[0].id}/')
+        missing = await self.async_client.get('/async/product/999999/')
+
+        self.assertEqual(response.json()['Product_name'], 'Product 0')
+        self.assertEqual(missing.status_code, 404)
+
+    async def test_cart_and_orders_need_a_token(self):
+        for url in ('/async/cart/', '/async/order/'):
+            self.assertEqual((await self.async_client.get(url)).status_code, 401)
+        bad = await self.async_client.get('/async/cart/', headers={'Authorization': 'Bearer nope'})
+        self.assertEqual(bad.status_code, 401)
+
+    async def test_customer_reads(self):
+        await CartItem.objects.acreate(cart=await Cart.objects.acreate(user=self.customer), product=self.products[0], quantity=2, total_price=Decimal('20.00'))
+
+        cart = (await self.async_client.get('/async/cart/', headers=self.auth)).json()
+        orders = (await self.async_client.get('/async/order/', headers=self.auth)).json()
+
+        self.assertEqual((cart['item_count'], cart['total_price']), (1, '20.00'))
+        self.assertEqual([order['id'] for order in orders['results']], [self.order.id])
+        self.assertEqual(len(orders['results'][0]['order_items']), 2)
+
+    async def test_writes_are_rejected(self):
+        response = await self.async_client.post('/async/product/', {})
+
+        self.assertEqual(response.status_code, 405)
+
+
+class EmailOutboxTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.owner = make_company('Acme', 'owner@acme.test').owner
+
+    def invite(self, email):
+        self.client.force_authenticate(self.owner)
+        return self.client.post('/invite/', {'email': email, 'role': 'staff'}, format='json')
+
+    def drain(self, **options):
+        call_command('send_outbox_emails', stdout=StringIO(), **options)
+
+    def test_invite_queues_instead_of_sending(self):
+        self.assertEqual(self.invite('new@acme.test').status_code, 201)
+
+        self.assertEqual(len(mail.outbox), 0)
+        queued = EmailOutbox.objects.get()
+        self.assertEqual((queued.to, queued.status), (['new@acme.test'], 'pending'))
+        self.assertTrue(CustomUser.objects.filter(email='new@acme.test').exists())
+
+    def test_worker_sends_batches_over_one_connection(self):
+        for i in range(5):
+            self.invite(f'new{i}@acme.test')
+
+        with mock.patch('ecomapp.outbox.get_connection', wraps=get_connection) as connections:
+            self.drain(batch_size=3)
+
+        self.assertEqual(connections.call_count, 2)
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), [f'new{i}@acme.test' for i in range(5)])
+        self.assertEqual(set(EmailOutbox.objects.values_list('status', 'body')), {('sent', '')})
+
+    def test_failures_back_off_then_give_up(self):
+        self.invite('new@acme.test')
+
+        with mock.patch('django.core.mail.EmailMessage.send', side_effect=ConnectionError('smtp down')):
+            self.drain(max_attempts=2)
+            queued = EmailOutbox.objects.get()
+            self.assertEqual((queued.status, queued.attempts, queued.last_error), ('pending', 1, 'smtp down'))
+            self.assertGreater(queued.next_attempt_at, timezone.now())
+
+            self.drain(max_attempts=2)  # not due yet
+            self.assertEqual(EmailOutbox.objects.get().attempts, 1)
+
+            EmailOutbox.objects.update(next_attempt_at=timezone.now())
+            self.drain(max_attempts=2)
+
+        self.assertEqual(EmailOutbox.objects.get().status, 'failed')
+        self.assertEqual(len(mail.outbox), 0)
+
+
+class BulkStatusTransitionTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.acme = make_company('Acme', 'owner@acme.test')
+        self.globex = make_company('Globex', 'owner@globex.test')
+        category = Category.objects.create(name='Books')
+        self.book = make_products(self.acme, category, 1)[0]
+        self.foreign = make_products(self.globex, category, 1)[0]
+        customer = CustomUser.objects.create_user('buyer@test', email='buyer@test', password='pass12345')
+        self.orders = [make_order(customer, [self.book]) for _ in range(4)]
+        self.foreign_order = make_order(customer, [self.foreign])
+        self.client.force_authenticate(self.acme.owner)
+
+    def transition(self, order_ids, target):
+        return self.client.post('/update-status/bulk/', {'order_ids': order_ids, 'status': target}, format='json')
+
+    def outcomes(self, response):
+        return {result['order']: result['outcome'] for result in response.data['results']}
+
+    def test_one_update_with_per_order_outcomes(self):
+        ids = [order.id for order in self.orders]
+        OrderCompanyStatus.objects.filter(order=self.orders[0]).update(status='shipped')
+        OrderCompanyStatus.objects.filter(order=self.orders[1]).update(status='delivered')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.transition(ids + [self.foreign_order.id, 999999], 'shipped')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.outcomes(response), {
+            ids[0]: 'unchanged', ids[1]: 'not_allowed', ids[2]: 'updated', ids[3]: 'updated',
+            self.foreign_order.id: 'not_found', 999999: 'not_found',
+        })
+        self.assertEqual(response.data['counts'], {'unchanged': 1, 'not_allowed': 1, 'updated': 2, 'not_found': 2})
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('UPDATE')]), 1)
+        self.assertEqual(OrderCompanyStatus.objects.get(order=self.foreign_order).status, 'pending')
+
+    def test_bulk_cancel_releases_stock(self):
+        Product.objects.filter(id=self.book.id).update(Quantity=90)
+
+        self.transition([order.id for order in self.orders], 'canceled')
+
+        self.assertEqual(Product.objects.get(id=self.book.id).Quantity, 98)
+
+    def test_single_update_enforces_transitions(self):
+        OrderCompanyStatus.objects.filter(order=self.orders[0]).update(status='delivered')
+
+        response = self.client.put(f'/update-status/{self.orders[0].id}/{self.acme.id}/', {'status': 'pending'}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(OrderCompanyStatus.objects.get(order=self.orders[0], company=self.acme).status, 'delivered')
+
+    def test_customers_and_staff_are_rejected(self):
+        staff = CustomUser.objects.create_user('staff@acme.test', email='staff@acme.test', password='pass12345', role='staff', company_user=self.acme)
+
+        for user in (CustomUser.objects.get(email='buyer@test'), staff):
+            self.client.force_authenticate(user)
+            self.assertEqual(self.transition([self.orders[0].id], 'shipped').status_code, 403)
+        self.assertEqual(OrderCompanyStatus.objects.get(order=self.orders[0]).status, 'pending')
+
+
+@override_settings(STATUS_FEED_POLL_INTERVAL=0.01)
+class OrderStatusFeedTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.acme = make_company('Acme', 'owner@acme.test')
+        self.globex = make_company('Globex', 'owner@globex.test')
+        category = Category.objects.create(name='Books')
+        self.book = make_products(self.acme, category, 1)[0]
+        self.foreign = make_products(self.globex, category, 1)[0]
+        self.customer = CustomUser.objects.create_user('buyer@test', email='buyer@test', password='pass12345')
+        self.other = CustomUser.objects.create_user('other@test', email='other@test', password='pass12345')
+        self.order = make_order(self.customer, [self.book, self.foreign])
+        self.other_order = make_order(self.other, [self.book])
+
+    def auth(self, user):
+        return {'Authorization': f'Bearer {tokens_for_user(user).access_token}'}
+
+    def test_status_changes_are_logged(self):
+        headers = self.auth(self.acme.owner)
+        self.client.put(f'/update-status/{self.order.id}/{self.acme.id}/', {'status': 'shipped'}, content_type='application/json', headers=headers)
+        self.client.post('/update-status/bulk/', {'order_ids': [self.order.id, self.other_order.id], 'status': 'delivered'}, content_type='application/json', headers=headers)
+
+        self.assertEqual(
+            list(OrderStatusEvent.objects.order_by('id').values_list('order_id', 'customer_id', 'previous_status', 'status')),
+            [(self.order.id, self.customer.id, 'pending', 'shipped'), (self.order.id, self.customer.id, 'shipped', 'delivered')],
+        )
+
+    async def test_long_poll_returns_scoped_events_after_cursor(self):
+        await sync_to_async(transition_statuses)(self.acme.id, [self.order.id, self.other_order.id], 'shipped')
+        await sync_to_async(transition_statuses)(self.globex.id, [self.order.id], 'canceled')
+
+        customer = (await self.async_client.get('/async/order-events/', {'after': 0, 'timeout': 1}, headers=self.auth(self.customer))).json()
+        company = (await self.async_client.get('/async/order-events/', {'after': 0, 'timeout': 1}, headers=self.auth(self.acme.owner))).json()
+        caught_up = (await self.async_client.get('/async/order-events/', {'after': customer['cursor'], 'timeout': 0}, headers=self.auth(self.customer))).json()
+
+        self.assertEqual([(event['company'], event['status']) for event in customer['events']], [(self.acme.id, 'shipped'), (self.globex.id, 'canceled')])
+        self.assertEqual(sorted(event['order'] for event in company['events']), sorted([self.order.id, self.other_order.id]))
+        self.assertEqual(caught_up, {'cursor': customer['cursor'], 'events': []})
+
+    async def test_waiting_subscriber_is_woken(self):
+        poll = asyncio.ensure_future(self.async_client.get('/async/order-events/', {'timeout': 5}, headers=self.auth(self.customer)))
+        await asyncio.sleep(0.1)
+        await sync_to_async(transition_statuses)(self.acme.id, [self.order.id], 'shipped')
+
+        events = (await poll).json()['events']
+
+        self.assertEqual([event['status'] for event in events], ['shipped'])
+
+    async def test_stream_resumes_from_last_event_id(self):
+        await sync_to_async(transition_statuses)(self.acme.id, [self.order.id], 'shipped')
+        await sync_to_async(transition_statuses)(self.acme.id, [self.order.id], 'delivered')
+        first = await OrderStatusEvent.objects.order_by('id').afirst()
+
+        response = await self.async_client.get('/async/order-events/stream/', headers={**self.auth(self.customer), 'Last-Event-ID': str(first.id)})
+        chunks = response.streaming_content
+        frames = [await anext(chunks), await anext(chunks)]
+        await chunks.aclose()
+
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertTrue(frames[0].startswith(b'retry:'))
+        self.assertIn(f'id: {first.id + 1}\n'.encode(), frames[1])
+        self.assertEqual(json.loads(frames[1].split(b'data: ')[1])['status'], 'delivered')
+
+    async def log_event(self, event_id, status):
+        return await OrderStatusEvent.objects.acreate(
+            id=event_id, order=self.order, company=self.acme, customer=self.customer, previous_status='pending', status=status,
+        )
+
+    async def test_lower_id_committed_later_is_not_skipped(self):
+        scope = event_scope(self.customer)
+        cursor = await status_feed.head()
+        # The transaction holding cursor + 1 commits after the one holding cursor + 2
+        await self.log_event(cursor + 2, 'shipped')
+
+        self.assertEqual(await status_feed.wait(scope, cursor, 0.2), [])
+        await self.log_event(cursor + 1, 'canceled')
+        events = await status_feed.wait(scope, cursor, 1)
+
+        self.assertEqual([event.id for event in events], [cursor + 1, cursor + 2])
+
+    @override_settings(STATUS_FEED_GAP_TIMEOUT=0.05)
+    async def test_abandoned_gap_stops_holding_back_events(self):
+        cursor = await status_feed.head()
+        await self.log_event(cursor + 2, 'shipped')
+
+        events = await status_feed.wait(event_scope(self.customer), cursor, 1)
+
+        self.assertEqual([event.id for event in events], [cursor + 2])
+
+    async def test_feed_needs_a_token(self):
+        self.assertEqual((await self.async_client.get('/async/order-events/')).status_code, 401)
+
+
+class SalesRollupTests(APITestCase):
+
+    def setUp(self):
+        self.acme = make_company('Acme', 'owner@acme.test')
+        self.globex = make_company('Globex', 'owner@globex.test')
+        self.books = Category.objects.create(name='Books')
+        self.games = Category.objects.create(name='Games')
+        self.book, self.novel = make_products(self.acme, self.books, 2, price=12.5)
+        self.game = make_products(self.acme, self.games, 1, price=20.0)[0]
+        self.foreign = make_products(self.globex, self.books, 1, price=3.0)[0]
+        self.customer = CustomUser.objects.create_user('buyer@test', email='buyer@test', password='pass12345')
+        self.client.force_authenticate(self.customer)
+
+    def place(self, lines):
+        return self.client.post('/order/', {
+            'location': 'Kathmandu', 'time_of_delivery': '10:00',
+            'order_items': [{'product': product.id, 'quantity': quantity} for product, quantity in lines],
+        }, format='json').data['id']
+
+    def rollups(self):
+        return {
+            (row.company_id, row.product_id): (row.quantity, row.revenue)
+            for row in SalesRollup.objects.filter(quantity__gt=0)
+        }
+
+    def assertMatchesRebuild(self):
+        incremental = self.rollups()
+        call_command('rebuild_sales_rollups', stdout=StringIO())
+        self.assertEqual(self.rollups(), incremental)
+
+    def test_orders_and_edits_update_rollups(self):
+        first = self.place([(self.book, 2), (self.foreign, 1)])
+        self.place([(self.book, 1), (self.game, 1)])
+        kept = OrderItem.objects.get(order_id=first, product=self.book)
+        self.client.post('/order/', {'id': first, 'order_items': [{'id': kept.id, 'quantity': 4}, {'product': self.novel.id, 'quantity': 1}]}, format='json')
+
+        self.assertEqual(self.rollups(), {
+            (self.acme.id, self.book.id): (5, Decimal('62.50')),
+            (self.acme.id, self.novel.id): (1, Decimal('12.50')),
+            (self.acme.id, self.game.id): (1, Decimal('20.00')),
+        })
+        self.assertMatchesRebuild()
+
+    def test_cancel_and_reopen(self):
+        order_id = self.place([(self.book, 2), (self.foreign, 1)])
+
+        transition_statuses(self.acme.id, [order_id], 'canceled')
+        self.assertEqual(self.rollups(), {(self.globex.id, self.foreign.id): (1, Decimal('3.00'))})
+        self.assertMatchesRebuild()
+
+        transition_statuses(self.acme.id, [order_id], 'pending')
+        self.assertEqual(self.rollups()[(self.acme.id, self.book.id)], (2, Decimal('25.00')))
+
+    def test_cancel_after_category_change(self):
+        order_id = self.place([(self.book, 2)])
+        self.client.force_authenticate(self.acme.owner)
+        response = self.client.patch(f'/product/{self.book.id}/', {'category_id': self.games.id, 'uploaded_images': []}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(list(SalesRollup.objects.filter(quantity__gt=0).values_list('category_id', 'quantity')), [(self.games.id, 2)])
+        transition_statuses(self.acme.id, [order_id], 'canceled')
+
+        self.assertFalse(SalesRollup.objects.exclude(quantity=0, revenue=0).exists())
+
+    def test_analytics_groups_the_company_range(self):
+        self.place([(self.book, 2), (self.game, 1), (self.foreign, 5)])
+        self.place([(self.novel, 1)])
+        SalesRollup.objects.create(company=self.acme, day=timezone.localdate() - datetime.timedelta(days=60), product=self.book, category=self.books, quantity=9, revenue=Decimal('99.00'))
+        self.client.force_authenticate(self.acme.owner)
+
+        with self.assertNumQueries(1):
+            by_category = self.client.get('/analytics/sales/', {'group_by': 'category'})
+        by_day = self.client.get('/analytics/sales/')
+
+        self.assertEqual(
+            [(row['category_name'], row['quantity'], row['revenue']) for row in by_category.data['results']],
+            [('Books', 3, Decimal('37.50')), ('Games', 1, Decimal('20.00'))],
+        )
+        self.assertEqual((by_day.data['quantity'], by_day.data['revenue']), (4, Decimal('57.50')))
+        self.assertEqual([row['day'] for row in by_day.data['results']], [timezone.localdate()])
+        bad = self.client.get('/analytics/sales/', {'date_from': '2024-01-01', 'date_to': '2026-01-01'})
+        self.assertEqual(bad.status_code, 400)
+
+
+class ProductFacetTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        catalog_cache.clear()
+        self.acme = make_company('Acme', 'owner@acme.test')
+        self.globex = make_company('Globex', 'owner@globex.test')
+        self.books = Category.objects.create(name='Books')
+        self.games = Category.objects.create(name='Games')
+        make_products(self.acme, self.books, 3, price=8.0)
+        make_products(self.acme, self.games, 1, price=40.0)
+        self.discounted = make_products(self.globex, self.books, 2, price=120.0)
+        Product.objects.filter(id=self.discounted[0].id).update(discount=50)
+
+    def counts(self, entries):
+        return {entry['name']: entry['count'] for entry in entries}
+
+    def test_counts_from_one_query(self):
+        with self.assertNumQueries(1):
+            facets = self.client.get('/product/facets/').data
+
+        self.assertEqual(facets['count'], 6)
+        self.assertEqual(self.counts(facets['category']), {'Books': 5, 'Games': 1})
+        self.assertEqual(self.counts(facets['company']), {'Acme': 4, 'Globex': 2})
+        self.assertEqual({(bucket['min'], bucket['max']): bucket['count'] for bucket in facets['price'] if bucket['count']}, {
+            (0, 10): 3, (25, 50): 1, (50, 100): 1, (100, 250): 1,
+        })
+
+    def test_each_facet_ignores_its_own_filter(self):
+        facets = self.client.get('/product/facets/', {'category': self.books.id, 'company': self.acme.id}).data
+
+        self.assertEqual(facets['count'], 3)
+        self.assertEqual(self.counts(facets['category']), {'Books': 3, 'Games': 1})
+        self.assertEqual(self.counts(facets['company']), {'Acme': 3, 'Globex': 2})
+
+    def test_cached_until_the_catalog_changes(self):
+        self.assertEqual(self.client.get('/product/facets/')['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/product/facets/')['X-Cache'], 'HIT')
+
+        bump_catalog_version(self.globex.id)
+        response = self.client.get('/product/facets/', {'company': self.acme.id})
+
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get('/product/facets/', {'category': 'x'}).status_code, 400)
+
+
+class ProductPriceFilterTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        catalog_cache.clear()
+        company = make_company('Acme', 'owner@acme.test')
+        category = Category.objects.create(name='Books')
+        self.products = Product.objects.bulk_create([
+            Product(Product_name=f'Product {price}', Quantity=10, price=price, discount=discount, Description='test product',
+                    company=company, category=category, Created_by=company.owner)
+            for price, discount in [(40.0, 0), (10.0, 0), (30.0, 50), (25.0, 0), (15.0, 0), (15.0, 20)]
+        ])
+
+    def prices(self, response):
+        return [product['discounted_price'] for product in response.data['results']]
+
+    def test_effective_price_matches_python(self):
+        for product in Product.objects.all():
+            self.assertEqual(product.effective_price, product.get_discounted_price())
+
+    def test_price_range_and_ordering_in_sql(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/product/', {'min_price': 12, 'max_price': 30, 'ordering': '-price'})
+
+        self.assertEqual(self.prices(response), [25.0, 15.0, 15.0, 12.0])
+        self.assertIn('ORDER BY "ecomapp_product"."effective_price" DESC', queries[0]['sql'])
+
+    def test_price_ordered_pages(self):
+        first = self.client.get('/product/', {'ordering': 'price', 'page_size': 2})
+        second = self.client.get(first.data['next'])
+        third = self.client.get(second.data['next'])
+
+        self.assertEqual(self.prices(first) + self.prices(second) + self.prices(third), [10.0, 12.0, 15.0, 15.0, 25.0, 40.0])
+        self.assertIsNone(third.data['next'])
+
+    def test_effective_price_follows_discount_changes(self):
+        Product.objects.filter(id=self.products[0].id).update(discount=75)
+
+        self.assertEqual(self.prices(self.client.get('/product/', {'max_price': 10})), [10.0, 10.0])
+
+
+class SignupTests(APITestCase):
+
+    def setUp(self):
+        self.acme = make_company('Acme', 'owner@acme.test')
+
+    def signup(self, email, **fields):
+        return self.client.post('/signup/', {'email': email, 'password': 'Xy7!longpass', 'Confirm_Password': 'Xy7!longpass', **fields}, format='json')
+
+    def test_admin_signup_creates_an_owned_company(self):
+        response = self.signup('new@globex.test', role='admin', company={'name': 'Globex'})
+
+        self.assertEqual(response.status_code, 201)
+        user = CustomUser.objects.get(email='new@globex.test')
+        self.assertEqual((user.company_user.name, user.company_user.owner_id), ('Globex', user.id))
+
+    def test_cannot_join_an_existing_company_or_pick_a_company_role(self):
+        for email, fields in [
+            ('a@test', {'role': 'admin', 'company': {'name': 'Acme'}}),
+            ('b@test', {'role': 'customer', 'company': {'name': 'Acme'}}),
+            ('c@test', {'role': 'staff'}),
+            ('d@test', {'role': 'admin'}),
+        ]:
+            self.assertEqual(self.signup(email, **fields).status_code, 400, fields)
+        self.assertEqual(list(CustomUser.objects.filter(company_user=self.acme).values_list('email', flat=True)), ['owner@acme.test'])
+
+    def test_update_cannot_change_role_or_claim_a_company(self):
+        customer = CustomUser.objects.create_user('buyer@test', email='buyer@test', password='pass12345')
+        self.client.force_authenticate(customer)
+
+        self.assertEqual(self.client.patch(f'/user/{customer.id}/', {'role': 'admin'}, format='json').status_code, 400)
+        self.assertEqual(self.client.patch(f'/user/{customer.id}/', {'company': {'name': 'Acme'}}, format='json').status_code, 400)
+        customer.refresh_from_db()
+        self.assertEqual((customer.role, customer.company_user_id), ('customer', None))
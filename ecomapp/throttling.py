@@ -0,0 +1,209 @@
+import math
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.redis import RedisCache
+from rest_framework.throttling import BaseThrottle
+
+
+LOGIN_METRICS = ['allowed', 'failed', 'throttled_ip', 'throttled_email']
+LOGIN_METRICS_KEY = 'login_throttle:metrics:{}'
+
+
+class SlidingWindow:
+    """
+    Sliding-window counter kept in the Django cache; shared by all workers only when `CACHES` is,
+    with LocMemCache each process counts on its own.
+
+    Each window is one counter key; the rate is the current window's count plus the previous window's
+    count weighted by how much of it still overlaps the last `window` seconds. That tracks a true
+    sliding log closely while costing two integers per identity.
+    """
+
+    def __init__(self, scope, limit, window):
+        self.scope = scope
+        self.limit = limit
+        self.window = window
+
+    def keys(self, ident, now):
+        index = int(now // self.window)
+        return (
+            f'login_throttle:{self.scope}:{ident}:{index}',
+            f'login_throttle:{self.scope}:{ident}:{index - 1}',
+        )
+
+    def retry_after(self, counts, ident, now):
+        """
+        Seconds until `ident` may try again, or 0 when it is under the limit. `counts` come from `cache.get_many`.
+        """
+        current_key, previous_key = self.keys(ident, now)
+        current, previous = counts.get(current_key, 0), counts.get(previous_key, 0)
+        elapsed = now % self.window
+        if previous * (1 - elapsed / self.window) + current < self.limit:
+            return 0
+        if current >= self.limit:
+            return math.ceil(self.window - elapsed)
+        # Wait until enough of the previous window has slid out
+        return max(1, math.ceil(self.window * (1 - (self.limit - current) / previous) - elapsed))
+
+    def hit(self, ident, now):
+        key = self.keys(ident, now)[0]
+        cache.add(key, 0, timeout=2 * self.window)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Evicted between add and incr
+            cache.set(key, 1, timeout=2 * self.window)
+
+
+class LoginThrottle:
+    """
+    Failed-login limits per client IP and per email, checked before any password hashing.
+
+    Only failures are counted, so a user who logs in normally is never throttled; a credential
+    stuffing run trips the IP limit and a password guessing run on one account trips the email limit.
+    Without a shared cache backend the counters are per process, so an attacker spread across N
+    workers gets up to N times the configured attempts.
+    """
+
+    def windows(self, request, email):
+        rates = getattr(settings, 'LOGIN_THROTTLE_RATES', {'ip': (50, 300), 'email': (5, 300)})
+        return [
+            (SlidingWindow('ip', *rates['ip']), BaseThrottle().get_ident(request)),
+            (SlidingWindow('email', *rates['email']), (email or '').strip().lower()),
+        ]
+
+    def check(self, request, email):
+        """
+        Seconds the caller must wait before trying again, or 0. One cache round trip.
+        """
+        now = time.time()
+        windows = self.windows(request, email)
+        counts = cache.get_many([key for window, ident in windows for key in window.keys(ident, now)])
+        for window, ident in windows:
+            wait = window.retry_after(counts, ident, now)
+            if wait:
+                record_login_metric(f'throttled_{window.scope}')
+                return wait
+        return 0
+
+    def failed(self, request, email):
+        now = time.time()
+        for window, ident in self.windows(request, email):
+            window.hit(ident, now)
+        record_login_metric('failed')
+
+
+def record_login_metric(name):
+    key = LOGIN_METRICS_KEY.format(name)
+    if not cache.add(key, 1, timeout=None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, timeout=None)
+
+
+def login_metrics():
+    counts = cache.get_many([LOGIN_METRICS_KEY.format(name) for name in LOGIN_METRICS])
+    return {name: counts.get(LOGIN_METRICS_KEY.format(name), 0) for name in LOGIN_METRICS}
+
+
+login_throttle = LoginThrottle()
+
+
+# Refill and take one token from every bucket in KEYS, or from none when any is empty.
+# ARGV: now, then capacity and refill rate (tokens per second) for each key. Returns the wait in seconds.
+TOKEN_BUCKET_SCRIPT = """
+local now = tonumber(ARGV[1])
+local wait = 0
+local tokens = {}
+for i, key in ipairs(KEYS) do
+    local capacity, rate = tonumber(ARGV[i * 2]), tonumber(ARGV[i * 2 + 1])
+    local bucket = redis.call('HMGET', key, 'tokens', 'ts')
+    local level = tonumber(bucket[1]) or capacity
+    local last = tonumber(bucket[2]) or now
+    level = math.min(capacity, level + math.max(0, now - last) * rate)
+    if level < 1 then
+        wait = math.max(wait, (1 - level) / rate)
+    end
+    tokens[i] = level
+end
+if wait == 0 then
+    for i, key in ipairs(KEYS) do
+        local capacity, rate = tonumber(ARGV[i * 2]), tonumber(ARGV[i * 2 + 1])
+        redis.call('HSET', key, 'tokens', tokens[i] - 1, 'ts', now)
+        redis.call('EXPIRE', key, math.ceil(capacity / rate) + 1)
+    end
+end
+return tostring(wait)
+"""
+
+DURATIONS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """
+    `'300/min'` -> `(300, 5.0)`: bucket capacity and refill rate in tokens per second.
+    """
+    num, period = rate.split('/')
+    capacity = int(num)
+    return capacity, capacity / DURATIONS[period[0]]
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Token-bucket rate limit per caller, with a budget per role from `TOKEN_BUCKET_RATES`.
+
+    Anonymous callers are keyed by IP and users by id; users that belong to a company also draw from
+    a bucket shared by the whole company. A request passes only if every bucket it draws from has a
+    token. Buckets live in the Django cache: on Redis one Lua script checks and updates them all in
+    a single round trip and every worker shares them. Other backends fall back to a read and a write
+    under a process lock, which is only atomic within one process; with the default LocMemCache each
+    worker also keeps its own buckets, so the effective limit is the rate times the number of workers.
+    Rejections get `429` with `Retry-After`.
+    """
+    _lock = threading.Lock()
+
+    def buckets(self, request):
+        rates = settings.TOKEN_BUCKET_RATES
+        user = request.user
+        if not (user and user.is_authenticated):
+            return [(f'rate:anon:{self.get_ident(request)}', parse_rate(rates['anon']))]
+        buckets = [(f'rate:user:{user.pk}', parse_rate(rates.get(user.role, rates['customer'])))]
+        if user.company_user_id:
+            buckets.append((f'rate:company:{user.company_user_id}', parse_rate(rates['company'])))
+        return buckets
+
+    def allow_request(self, request, view):
+        buckets = self.buckets(request)
+        if isinstance(cache, RedisCache):
+            self._wait = self.take_redis(buckets, time.time())
+        else:
+            self._wait = self.take_locked(buckets, time.time())
+        return self._wait == 0
+
+    def wait(self):
+        return self._wait
+
+    def take_redis(self, buckets, now):
+        keys = [cache.make_key(key) for key, rate in buckets]
+        args = [now]
+        for key, (capacity, refill) in buckets:
+            args += [capacity, refill]
+        client = cache._cache.get_client(keys[0], write=True)
+        return float(client.eval(TOKEN_BUCKET_SCRIPT, len(keys), *keys, *args))
+
+    def take_locked(self, buckets, now):
+        with self._lock:
+            state = cache.get_many([key for key, rate in buckets])
+            levels, wait = {}, 0
+            for key, (capacity, refill) in buckets:
+                level, last = state.get(key, (capacity, now))
+                levels[key] = min(capacity, level + max(0, now - last) * refill)
+                if levels[key] < 1:
+                    wait = max(wait, (1 - levels[key]) / refill)
+            if wait:
+                return wait
+            cache.set_many({key: (levels[key] - 1, now) for key in levels}, timeout=max(math.ceil(capacity / refill) + 1 for key, (capacity, refill) in buckets))
+            return 0
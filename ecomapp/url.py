@@ -1,7 +1,8 @@
 from django.urls import path,include
-from .views import UserOrderBulkView,OrderCompanyStatusUpdateView,ProductViewSet,accept_invitation,InviteUserView,CompanyView,UserSignup,LoginAPIView,UserUpdate,AdminOrderView,CartItemViewSet
+from .views import UserOrderBulkView,OrderCompanyStatusUpdateView,OrderCompanyStatusBulkUpdateView,ProductViewSet,accept_invitation,InviteUserView,CompanyView,UserSignup,LoginAPIView,UserUpdate,AdminOrderView,CartItemViewSet,MetricsView,SalesAnalyticsView
 
 from rest_framework.routers import DefaultRouter
+from . import async_views
 
 orders_router = DefaultRouter()
 orders_router.register(r'orders', AdminOrderView, basename='admin-orders')
@@ -27,6 +28,16 @@ urlpatterns = [
     path('order/', UserOrderBulkView.as_view(), name='order'),
     path('invite/accept/<str:token>/', accept_invitation, name='accept_invitation'),
     path('update-status/<int:order_id>/<int:company_id>/', OrderCompanyStatusUpdateView.as_view(), name='order-company-status-update'),
+    path('update-status/bulk/', OrderCompanyStatusBulkUpdateView.as_view(), name='order-company-status-bulk-update'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+    path('analytics/sales/', SalesAnalyticsView.as_view(), name='sales-analytics'),
+    # Async reads for the ASGI deployment (ecom/asgi.py)
+    path('async/product/', async_views.product_list, name='async-product-list'),
+    path('async/product/<int:pk>/', async_views.product_detail, name='async-product-detail'),
+    path('async/cart/', async_views.cart_summary, name='async-cart'),
+    path('async/order/', async_views.order_list, name='async-order-list'),
+    path('async/order-events/', async_views.order_events, name='async-order-events'),
+    path('async/order-events/stream/', async_views.order_event_stream, name='async-order-event-stream'),
 
            
 ]